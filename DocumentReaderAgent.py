@@ -1,110 +1,210 @@
-import docx
+import asyncio
 import zipfile
+import logging
 import os
-import io
-import base64
+import posixpath
 import re
-from PIL import Image
-from typing import List, Dict, Any, Union
+import xml.etree.ElementTree as ET
+from typing import List, Dict, Any, Iterator, Optional, Union
 
-import google.generativeai as genai
 from google.adk.agents import Agent
 from google.adk.tools import FunctionTool
 
-from config import GEMINI_API_KEY
+from llm_cache import cached_generate, acached_generate
+from config import VISION_BATCH_MAX_IMAGES, SUMMARY_CONCURRENCY
+from image_utils import image_digest, prepare_image
+from job_store import JobCheckpoint
+from tracing import span
+from image_batcher import chunk_images, explain_images, aexplain_images
+from clients import gemini_model
 # ==================== 1. Configure Gemini & Models ====================
 
-genai.configure(api_key=GEMINI_API_KEY)
-vision_model = genai.GenerativeModel("gemini-2.5-flash")
-text_model = genai.GenerativeModel("gemini-2.0-flash-lite")
+# Models are created on first use (see clients.py), not at import
+VISION_MODEL = "gemini-2.5-flash"
+TEXT_MODEL = "gemini-2.0-flash-lite"
 
-# ==================== 2. Helper Functions (Image Handling) ====================
+logger = logging.getLogger(__name__)
 
-class DocumentReaderAgent (Agent):
+# ==================== 2. Helper Functions (DOCX XML & Image Handling) ====================
 
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+R_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+V_NS = "{urn:schemas-microsoft-com:vml}"
+MC_NS = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def read_relationships(docx_zip: zipfile.ZipFile) -> Dict[str, str]:
+    """Maps each relationship id of word/document.xml to the zip part it points to."""
+    try:
+        root = ET.fromstring(docx_zip.read("word/_rels/document.xml.rels"))
+    except KeyError:
+        return {}
+
+    targets = {}
+    for rel in root.iter(f"{PKG_REL_NS}Relationship"):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target", "")
+        part = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("word", target))
+        targets[rel.get("Id")] = part
+    return targets
+
+
+def read_style_names(docx_zip: zipfile.ZipFile) -> Dict[str, str]:
+    """Maps paragraph style ids (e.g. 'Heading1') to display names (e.g. 'Heading 1')."""
+    try:
+        root = ET.fromstring(docx_zip.read("word/styles.xml"))
+    except KeyError:
+        return {}
+
+    names = {}
+    for style in root.iter(f"{W_NS}style"):
+        name = style.find(f"{W_NS}name")
+        if name is not None:
+            value = name.get(f"{W_NS}val", "")
+            # Built-in styles are stored lower-case ('heading 1'); Word shows them capitalised
+            names[style.get(f"{W_NS}styleId")] = value[:1].upper() + value[1:]
+    return names
+
+
+def iter_docx_paragraphs(docx_zip: zipfile.ZipFile):
+    """
+    Streams word/document.xml once and yields (text, style_id, embed_ids) per
+    paragraph. Drawings inside a paragraph (including text boxes) are attributed
+    to it; mc:Fallback copies are skipped so nothing is counted twice.
+    """
+    depth = 0
+    fallback_depth = 0
+    text_parts: List[str] = []
+    style_id = None
+    embed_ids: List[str] = []
+
+    with docx_zip.open("word/document.xml") as xml_file:
+        for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+            tag = elem.tag
+
+            if tag == f"{MC_NS}Fallback":
+                fallback_depth += 1 if event == "start" else -1
+                continue
+            if tag == f"{W_NS}p":
+                if event == "start":
+                    depth += 1
+                    if depth == 1:
+                        text_parts, style_id, embed_ids = [], None, []
+                    continue
+                depth -= 1
+                if depth == 0:
+                    yield "".join(text_parts), style_id, embed_ids
+                    elem.clear()
+                continue
+            if event != "end" or depth == 0 or fallback_depth:
+                continue
+
+            if depth == 1 and tag == f"{W_NS}t":
+                text_parts.append(elem.text or "")
+            elif depth == 1 and tag == f"{W_NS}tab":
+                text_parts.append("\t")
+            elif depth == 1 and tag in (f"{W_NS}br", f"{W_NS}cr"):
+                text_parts.append("\n")
+            elif depth == 1 and tag == f"{W_NS}pStyle":
+                style_id = elem.get(f"{W_NS}val")
+            elif tag == f"{A_NS}blip":
+                embed_ids.append(elem.get(f"{R_NS}embed"))
+            elif tag == f"{V_NS}imagedata":
+                embed_ids.append(elem.get(f"{R_NS}id"))
+
+
+class DocumentReaderAgent (Agent):
 
-    def extract_all_images_to_base64(self, doc_path: str) -> Dict[str, str]:
-        """
-        Extracts all images from a DOCX file (zip archive) and returns them
-        as a dictionary mapping the image part name (e.g., 'image1.jpeg') to its base64 string.
-        """
-        images = {}
-        try:
-            # DOCX is a zip file, images are in 'word/media/'
-            with zipfile.ZipFile(doc_path, 'r') as docx_zip:
-                media_files = [name for name in docx_zip.namelist() if name.startswith('word/media/')]
-                
-                for media_file in media_files:
-                    if not os.path.basename(media_file).startswith('.'):
-                        with docx_zip.open(media_file) as image_file:
-                            image_bytes = image_file.read()
-                            base64_img = base64.b64encode(image_bytes).decode('utf-8')
-                            images[os.path.basename(media_file)] = base64_img
-        except Exception as e:
-            print(f"Warning: Could not extract all images from DOCX. Details: {e}")
-            
-        return images
 
     # ==================== 3. Tool Functions ====================
 
-    def extract_text_and_images_tool(self, doc_path: str) -> tuple[List[Dict[str, Union[str, List[str]]]], Dict[str, str]]:
+    def extract_text_and_images_tool(self, doc_path: str) -> tuple[List[Dict[str, Union[str, List[str]]]], List[str]]:
         """
-        Extracts text from a DOCX file, identifies image references within paragraphs,
-        and returns a list of text chunks plus a dictionary of all image base64 data.
+        Extracts text from a DOCX file in a single streaming pass over word/document.xml.
+        Each drawing's r:embed id is resolved to its exact media part, so every chunk
+        lists only the images it actually contains. Returns the text chunks plus the
+        media parts referenced anywhere in the document (image bytes are not read here).
         """
-        # This is the line that throws PackageNotFoundError if the file is not found/valid:
-        doc = docx.Document(doc_path)
-        all_images_data = self.extract_all_images_to_base64(doc_path) 
-        
-        chunks = []
-        
-        for paragraph in doc.paragraphs:
-            text = paragraph.text
-            style_name = paragraph.style.name if paragraph.style else "Normal"
-            
-            # Check XML for image data reference (using a heuristic for simplicity)
-            has_image = 'graphicData' in paragraph._p.xml
-            
-            chunk = {
-                "text": text.strip(),
-                "style": style_name,
-                "image_references": []
-            }
-            
-            if has_image and all_images_data:
-                # Assign ALL extracted image names to the chunk that contains an image marker
-                chunk["image_references"] = list(all_images_data.keys())
-                
-            chunks.append(chunk)
-
-        return chunks, all_images_data
+        # Throws BadZipFile/KeyError if the file is not found/valid:
+        with zipfile.ZipFile(doc_path, 'r') as docx_zip:
+            relationships = read_relationships(docx_zip)
+            style_names = read_style_names(docx_zip)
+
+            chunks = []
+            referenced_parts = []
+
+            for text, style_id, embed_ids in iter_docx_paragraphs(docx_zip):
+                image_parts = []
+                for embed_id in embed_ids:
+                    part = relationships.get(embed_id)
+                    if part and part not in image_parts:
+                        image_parts.append(part)
+                        if part not in referenced_parts:
+                            referenced_parts.append(part)
+
+                chunks.append({
+                    "text": text.strip(),
+                    "style": style_names.get(style_id, "Normal") if style_id else "Normal",
+                    "image_references": image_parts
+                })
+
+        return chunks, referenced_parts
 
     def summarize_text_tool(self, context_text: str) -> str:
         """Uses the text model to provide a brief one-line summary of the text."""
         if not context_text:
             return ""
         prompt = f"Provide a brief one-line summary of this:\n{context_text[:2000]}"
-        resp = text_model.generate_content(prompt)
-        return resp.text.strip() if resp.text else ""
-
-    def explain_image_tool(self, image_base64: str, context_summary: str) -> str:
-        """Uses the vision model to describe a base64 encoded image, connecting it to context."""
-        if not image_base64:
-            return "No image data provided for explanation."
-            
+        return cached_generate(gemini_model(TEXT_MODEL), prompt)
+
+    async def asummarize_text_tool(self, context_text: str) -> str:
+        """Async counterpart of summarize_text_tool."""
+        if not context_text:
+            return ""
+        prompt = f"Provide a brief one-line summary of this:\n{context_text[:2000]}"
+        return await acached_generate(gemini_model(TEXT_MODEL), prompt)
+
+    def explain_image_tool(self, doc_path: str, image_part: str, context_summary: str) -> str:
+        """
+        Uses the vision model to describe one image of the document, connecting it to context.
+        `image_part` is a media part name from the chunk's image_references (e.g. 'word/media/image1.png').
+        """
+        if not image_part:
+            return "No image reference provided for explanation."
+
         try:
-            image_bytes = base64.b64decode(image_base64)
-        except:
-            return "Error: Could not decode image data."
-            
-        img = Image.open(io.BytesIO(image_bytes))
-        prompt = (
+            with zipfile.ZipFile(doc_path, 'r') as docx_zip:
+                image_bytes = docx_zip.read(image_part)
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return f"Error: Could not read image '{image_part}' from the document."
+
+        return self.explain_image_bytes(prepare_image(image_bytes), context_summary)
+
+    def explain_images_bytes(self, images: List[bytes], context_summary: str) -> List[str]:
+        """Describes all images of one paragraph, in order, with a single vision request."""
+        return explain_images(gemini_model(VISION_MODEL), images, context_summary, self.explain_image_bytes)
+
+    def _image_prompt(self, context_summary: str) -> str:
+        return (
             "Write one concise, natural sentence describing the image. "
             "Use the summary for context but do not reference the text or summary directly. "
             f"\n\nSummary (for context): {context_summary}\n"
         )
-        resp = vision_model.generate_content([prompt, img])
-        return resp.text.strip()
+
+    def explain_image_bytes(self, image_bytes: bytes, context_summary: str) -> str:
+        """Describes already-decoded (and preferably downscaled) image bytes with the vision model."""
+        return cached_generate(gemini_model(VISION_MODEL), self._image_prompt(context_summary), [image_bytes])
+
+    async def aexplain_images_bytes(self, images: List[bytes], context_summary: str) -> List[str]:
+        """Async counterpart of explain_images_bytes."""
+        return await aexplain_images(gemini_model(VISION_MODEL), images, context_summary, self.aexplain_image_bytes)
+
+    async def aexplain_image_bytes(self, image_bytes: bytes, context_summary: str) -> str:
+        """Async counterpart of explain_image_bytes."""
+        return await acached_generate(gemini_model(VISION_MODEL), self._image_prompt(context_summary), [image_bytes])
 
     def clean_text_tool(self, raw_text: str) -> str:
         """Cleans up raw text, structuring it with paragraphs and chapter breaks."""
@@ -115,8 +215,6 @@ class DocumentReaderAgent (Agent):
         buffer_para = []
         chapter_active = False
 
-        print("cleaning raw text...")
-
         for line in lines:
             stripped = line.strip()
             if chapter_pattern.match(stripped):
@@ -152,7 +250,7 @@ class DocumentReaderAgent (Agent):
             instruction="""
             You are a Word Document Extraction Agent. Your task is to process the document content.
             1. **Extract:** Use the 'extract_text_and_images_tool' to get text chunks and image references.
-            2. **Process:** For each chunk: summarize the text, and if image references exist, use the 'explain_image_tool' with the corresponding base64 image data and the summary for context.
+            2. **Process:** For each chunk: summarize the text, and if image references exist, use the 'explain_image_tool' with the document path, each referenced image part and the summary for context.
             3. **Combine:** Combine all original text, summaries, and image explanations sequentially.
             4. **Clean:** Finally, use the 'clean_text_tool' on the entire combined output.
             """,
@@ -165,57 +263,169 @@ class DocumentReaderAgent (Agent):
             output_key="cleaned_doc_content")
         pass
 
+    def _iter_paragraphs(self, doc_path: str, all_chunks: List[Dict[str, Any]], checkpoint: JobCheckpoint,
+                         explained_images: Dict[str, Optional[str]]) -> Iterator[Dict[str, Any]]:
+        """
+        Yields one record per paragraph: its heading marker, text, image digests in
+        document order, the images not yet explained (digest, downscaled bytes) and
+        the text to summarize as their context. Each unique image is new only once
+        per document; explanations already checkpointed are put in `explained_images`.
+        """
+        # Image bytes are read lazily, only for the images that get explained
+        previous_text = ""
+        with zipfile.ZipFile(doc_path, 'r') as docx_zip:
+            for idx, chunk in enumerate(all_chunks):
+                text = chunk["text"].strip()
+
+                # Every image associated with this chunk, in document order
+                paragraph_images = {}
+                for image_part in chunk["image_references"]:
+                    try:
+                        image_bytes = docx_zip.read(image_part)
+                    except KeyError:
+                        continue
+                    if image_bytes:
+                        paragraph_images.setdefault(image_digest(image_bytes), image_bytes)
+
+                new_images = []
+                for digest, image_bytes in paragraph_images.items():
+                    if digest not in explained_images:
+                        explained_images[digest] = checkpoint.get("image", digest)
+                        if explained_images[digest] is None:
+                            new_images.append((digest, prepare_image(image_bytes)))
+
+                yield {
+                    "index": idx,
+                    "heading": f"# {chunk['style']}:" if chunk['style'].startswith('Heading') else "",
+                    "text": text,
+                    "digests": list(paragraph_images),
+                    "new_images": new_images,
+                    # The summary falls back to the previous paragraph when the image stands alone
+                    "context": text or previous_text,
+                }
+                if text:
+                    previous_text = text
+
+    def _combine_paragraphs(self, paragraphs: List[Dict[str, Any]], explained_images: Dict[str, Optional[str]],
+                            checkpoint: JobCheckpoint) -> str:
+        combined_raw_text = []
+        for paragraph in paragraphs:
+            # Start the chunk output
+            combined_raw_text.append(f"\n{paragraph['heading']}")
+
+            for digest in paragraph["digests"]:
+                img_explanation = explained_images[digest]
+                combined_raw_text.append(f"\n\nImage Explanation : {img_explanation}\n\n")
+
+            # Append the full text of the paragraph/section
+            if paragraph["text"]:
+                combined_raw_text.append(paragraph["text"])
+
+        # 3. Clean the combined output
+        full_raw_text = "\n".join(combined_raw_text)
+
+        # Clean the output
+        with span("clean", bytes_in=len(full_raw_text.encode("utf-8"))) as record:
+            cleaned_output = self.clean_text_tool(full_raw_text)
+            record["bytes_out"] = len(cleaned_output.encode("utf-8"))
+        checkpoint.put("output", "cleaned", cleaned_output)
+        return cleaned_output
+
+    def _save_explanations(self, group, explanations: List[str], explained_images: Dict[str, Optional[str]],
+                           checkpoint: JobCheckpoint) -> None:
+        for (digest, _), explanation in zip(group, explanations):
+            explained_images[digest] = explanation
+            checkpoint.put("image", digest, explanation)
+
+    def _extract_chunks(self, doc_path: str) -> List[Dict[str, Any]]:
+        with span("extract", bytes_in=os.path.getsize(doc_path)) as record:
+            all_chunks, _ = self.extract_text_and_images_tool(doc_path)
+            record["paragraphs"] = len(all_chunks)
+            record["bytes_out"] = sum(len(chunk["text"].encode("utf-8")) for chunk in all_chunks)
+        return all_chunks
+
     def process_word_doc(self, doc_path: str) -> str:
         """
         Manually orchestrates the Word document processing workflow, including images.
         """
-        print(f"Starting extraction for {doc_path}...")
+        logger.info("Starting extraction for %s", doc_path)
+
+        # Finished work is checkpointed under the document's content hash so a re-run resumes
+        checkpoint = JobCheckpoint.for_file(doc_path)
+        cleaned_output = checkpoint.get("output", "cleaned")
+        if cleaned_output is not None:
+            logger.info("Document already processed, reusing checkpointed output")
+            return cleaned_output
         
         # 1. Extraction: Get all chunks and all image data
-    
-        all_chunks, all_images_data = self.extract_text_and_images_tool(doc_path)
+        all_chunks = self._extract_chunks(doc_path)
 
-        combined_raw_text = []
+        # Each unique image is downscaled and explained only once per document
+        explained_images = {}
         
         # 2. Iterate and process each chunk 
-        for idx, chunk in enumerate(all_chunks):
-            text = chunk["text"].strip()
-            
-            heading_marker = f"# {chunk['style']}:" if chunk['style'].startswith('Heading') else ""
-            
-            # Get text summary
-            summary = self.summarize_text_tool(text)
-            
-            # Start the chunk output
-            combined_raw_text.append(f"\n{heading_marker}")
-        
-            
-            # Process images associated with this chunk
-            if chunk["image_references"]:
-                # Use the first image reference 
-                image_name = chunk["image_references"][0]
-                if image_name in all_images_data:
-                    image_base64 = all_images_data[image_name]
-                    
-                    # Explain the image using the text summary as context
-                    img_explanation = self.explain_image_tool(image_base64, summary)
-                    combined_raw_text.append(f"\n\nImage Explanation : {img_explanation}\n\n")
-            
-            # Append the full text of the paragraph/section
-            if text:
-                combined_raw_text.append(text)
-            
-        
-        # 3. Clean the combined output
-        full_raw_text = "\n".join(combined_raw_text)
+        paragraphs = []
+        for paragraph in self._iter_paragraphs(doc_path, all_chunks, checkpoint, explained_images):
+            if paragraph["new_images"]:
+                # The summary is only image context, so it is computed on demand here
+                with span("summarize", paragraph=paragraph["index"]):
+                    summary = self.summarize_text_tool(paragraph["context"])
 
-        print("raw text extraction done...")
+                # Explain all new images of the paragraph in one request, using the summary as context
+                for group in chunk_images(paragraph["new_images"], VISION_BATCH_MAX_IMAGES):
+                    images = [image_bytes for _, image_bytes in group]
+                    with span("vision", paragraph=paragraph["index"], images=len(images), bytes_in=sum(map(len, images))):
+                        explanations = self.explain_images_bytes(images, summary)
+                    self._save_explanations(group, explanations, explained_images, checkpoint)
+                # The image bytes are not needed once explained
+                paragraph["new_images"] = []
+            paragraphs.append(paragraph)
 
-        # Clean the output
-        cleaned_output = self.clean_text_tool(full_raw_text)
+        cleaned_output = self._combine_paragraphs(paragraphs, explained_images, checkpoint)
 
-        print("\n" + "="*50)
-        print("✅ Document processed successfully!")
-        print("="*50)
+        logger.info("✅ Document processed successfully: %s", doc_path)
         
         return cleaned_output
+
+    async def aprocess_word_doc(self, doc_path: str) -> str:
+        """
+        Async counterpart of process_word_doc. Parsing, image decoding and cleaning
+        run in the default executor; the paragraphs' summary and vision requests are
+        then awaited concurrently, at most SUMMARY_CONCURRENCY paragraphs at once.
+        """
+        logger.info("Starting extraction for %s", doc_path)
+
+        checkpoint = await asyncio.to_thread(JobCheckpoint.for_file, doc_path)
+        cleaned_output = checkpoint.get("output", "cleaned")
+        if cleaned_output is not None:
+            logger.info("Document already processed, reusing checkpointed output")
+            return cleaned_output
+
+        all_chunks = await asyncio.to_thread(self._extract_chunks, doc_path)
+
+        # Unlike the sync path, the new (downscaled) images of the whole document are
+        # held in memory until explained, so every request can be in flight together
+        explained_images = {}
+        paragraphs = await asyncio.to_thread(
+            lambda: list(self._iter_paragraphs(doc_path, all_chunks, checkpoint, explained_images)))
+
+        semaphore = asyncio.Semaphore(max(1, SUMMARY_CONCURRENCY))
+
+        async def explain(paragraph: Dict[str, Any]) -> None:
+            async with semaphore:
+                with span("summarize", paragraph=paragraph["index"]):
+                    summary = await self.asummarize_text_tool(paragraph["context"])
+                for group in chunk_images(paragraph["new_images"], VISION_BATCH_MAX_IMAGES):
+                    images = [image_bytes for _, image_bytes in group]
+                    with span("vision", paragraph=paragraph["index"], images=len(images), bytes_in=sum(map(len, images))):
+                        explanations = await self.aexplain_images_bytes(images, summary)
+                    self._save_explanations(group, explanations, explained_images, checkpoint)
+            paragraph["new_images"] = []
+
+        await asyncio.gather(*(explain(paragraph) for paragraph in paragraphs if paragraph["new_images"]))
+
+        cleaned_output = await asyncio.to_thread(self._combine_paragraphs, paragraphs, explained_images, checkpoint)
+
+        logger.info("✅ Document processed successfully: %s", doc_path)
+
+        return cleaned_output
@@ -1,13 +1,31 @@
+import logging
+import os
 import streamlit as st
 import tempfile
-from orchestrator import Orchestrator
-from chunker import chunk_text_for_narration
-from NarratorAgent import NarratorAgent
+from config import QUEUE_POLL_INTERVAL
+from job_queue import JobQueue, DONE, FAILED
+from worker import start_workers, discard_job_output
 
-orchestrator = Orchestrator()
-narrator = NarratorAgent()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
+
+@st.cache_resource
+def job_queue():
+    # Extraction and narration run in worker processes shared by every session;
+    # with QUEUE_WORKERS=0 the workers are expected to run separately (python worker.py).
+    # Each worker serves its own /metrics (METRICS_PORT + worker index).
+    start_workers()
+    return JobQueue()
+
+
+# Page config must stay the first Streamlit call, ahead of starting the workers
 st.set_page_config(page_title="EduNarrator", layout="wide")
+queue = job_queue()
+
+# Jobs are polled from fragments that rerun on this interval, so a script run never
+# blocks on a job and an interrupted run picks the same job up again
+POLL_SECONDS = max(1.0, QUEUE_POLL_INTERVAL)
+
 st.title("EduNarrator")
 
 st.sidebar.markdown("Upload a PDF or Word Document to receive full narration.")
@@ -32,13 +50,92 @@ defaults = {
     "processed_text": None,
     "chunked_text": None,
     "audio_ready": False,
-    "final_audio_file": None,
+    "final_audio": None,
+    # queue jobs of this session that have not finished yet, and why the last ones failed
+    "process_job_id": None,
+    "narrate_job_id": None,
+    "process_error": None,
+    "narrate_error": None,
+    # the finished narration whose part players are still on screen (its files are kept
+    # until the user moves on: a new upload or the next Generate Audio)
+    "narrated_job_id": None,
+    "narrate_parts": [],
     # selected voice stored persistently
     "voice_key": "English (en-US)",
 }
 for k, v in defaults.items():
     st.session_state.setdefault(k, v)
 
+
+# -------------------- job polling --------------------
+@st.fragment(run_every=POLL_SECONDS)
+def process_status():
+    job_id = st.session_state.process_job_id
+    job = queue.get(job_id)
+    if job is None or job["status"] in (DONE, FAILED):
+        st.session_state.process_job_id = None
+        if job is None:
+            st.session_state.process_error = f"job {job_id} no longer exists"
+        elif job["status"] == FAILED:
+            st.session_state.process_error = job["error"]
+        else:
+            st.session_state.processed_text = job["result"]["text"]
+            st.session_state.chunked_text = job["result"]["chunks"]
+        st.rerun()
+
+    stage = (job["progress"] or {}).get("stage", job["status"])
+    st.info(f"Reading PDF → Vision → Cleaning → Chunking ... ({stage})", icon="⏳")
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def narrate_status():
+    job_id = st.session_state.narrate_job_id
+    job = queue.get(job_id)
+    if job is None or job["status"] in (DONE, FAILED):
+        st.session_state.narrate_job_id = None
+        if job is None:
+            st.session_state.narrate_error = f"job {job_id} no longer exists"
+        elif job["status"] == FAILED:
+            st.session_state.narrate_error = job["error"]
+            discard_job_output(job_id)
+        else:
+            # Keep the merged MP3 in this session; the part files stay for the players
+            # that may still be playing (TTS runs well ahead of playback)
+            with open(job["result"]["audio_path"], "rb") as fh:
+                st.session_state["final_audio"] = fh.read()
+            st.session_state["audio_ready"] = True
+            st.session_state["narrated_job_id"] = job_id
+            st.session_state["narrate_parts"] = job["result"]["parts"]
+        st.rerun()
+
+    show_parts(job["progress"] or {})
+
+
+def show_parts(job_progress):
+    # Play part 1 as soon as the worker reports it while later parts are still being synthesized
+    parts = job_progress.get("parts", [])
+    total = job_progress.get("total") or len(st.session_state.chunked_text)
+    if job_progress.get("stage") == "done":
+        st.progress(1.0, text=f"Generated all {total} parts")
+    elif job_progress.get("stage") == "merging":
+        st.progress(1.0, text="Merging audio...")
+    elif parts:
+        st.progress(len(parts) / total, text=f"Generated part {len(parts)} of {total}")
+    else:
+        st.progress(0.0, text="Generating audio...")
+    for i, part_path in enumerate(parts):
+        st.caption(f"Part {i+1} of {total}")
+        st.audio(part_path, format="audio/mp3", autoplay=(i == 0))
+
+
+def discard_narration():
+    """Drops the finished narration's part players and files, once the user has moved on."""
+    if st.session_state.narrated_job_id:
+        discard_job_output(st.session_state.narrated_job_id)
+    st.session_state.narrated_job_id = None
+    st.session_state.narrate_parts = []
+
+
 # -------------------- upload UI -------------------
 uploaded_file = st.file_uploader("Upload a PDF or DOCX", type=["pdf", "docx"])
 
@@ -49,6 +146,10 @@ if uploaded_file is not None:
     # check name to avoid re-saving same file on rerun
     incoming_name = uploaded_file.name
     if (not prev_tmp) or (st.session_state.get("_uploaded_name") != incoming_name):
+        # The previous upload is no longer needed
+        if prev_tmp and os.path.exists(prev_tmp):
+            os.remove(prev_tmp)
+
         # save file to tmp and set state
         suffix = "." + incoming_name.split(".")[-1]
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
@@ -57,13 +158,22 @@ if uploaded_file is not None:
         st.session_state["tmp_file_path"] = tmp_path
         st.session_state["_uploaded_name"] = incoming_name
 
+        # Jobs of the previous upload are no longer awaited; their outputs are not needed
+        if st.session_state.get("narrate_job_id"):
+            discard_job_output(st.session_state["narrate_job_id"])
+        discard_narration()
+
         # Reset pipeline state for new upload
         st.session_state["file_uploaded"] = True
         st.session_state["processing_started"] = False
         st.session_state["processed_text"] = None
         st.session_state["chunked_text"] = None
         st.session_state["audio_ready"] = False
-        st.session_state["final_audio_file"] = None
+        st.session_state["final_audio"] = None
+        st.session_state["process_job_id"] = None
+        st.session_state["narrate_job_id"] = None
+        st.session_state["process_error"] = None
+        st.session_state["narrate_error"] = None
         # voice_key keep default or user choice preserved
 
         st.success(f"Uploaded: {incoming_name}", icon="✅")
@@ -76,15 +186,16 @@ if uploaded_file is not None:
             st.info(f"Ready to process: {st.session_state.get('_uploaded_name')}")
 
         # -------------------- Start Processing button --------------------
-        if st.button("Start Processing", key="start_processing_btn"):
-            with st.spinner("Reading PDF → Vision → Cleaning → Chunking ..."):
-                final_output = orchestrator.route_task(st.session_state.tmp_file_path)
+        # The job id lives in session state, so a rerun never submits the same document twice
+        if st.button("Start Processing", key="start_processing_btn",
+                     disabled=bool(st.session_state.process_job_id)):
+            st.session_state.process_job_id = queue.submit("process", {"file_path": st.session_state.tmp_file_path})
+            st.session_state.process_error = None
 
-                st.session_state.processed_text = final_output
-                st.session_state.chunked_text = chunk_text_for_narration(final_output)
-                st.success("Processing complete ✅")
-
-        
+        if st.session_state.process_job_id:
+            process_status()
+        elif st.session_state.process_error:
+            st.error(f"Processing failed: {st.session_state.process_error}")
 
     # -------------------- Voice selection (persistent) --------------------
     # Only show voice selector when we have chunked text
@@ -121,37 +232,41 @@ if uploaded_file is not None:
             st.session_state["voice_key"] = selected_voice
 
         # Only synthesize when user explicitly clicks this button
-        if st.button("Generate Audio", key="generate_audio_btn"):
-            with st.spinner("Generating audio..."):
-                voice_code = LANGUAGE_CODE_MAP[st.session_state["voice_key"]]
-                # narrator.synthesize_speech should return path to saved mp3 file
-                final_audio_path = narrator.synthesize_speech(
-                    chunks=st.session_state.chunked_text, language=voice_code
-                )
-                st.session_state["final_audio_file"] = final_audio_path
-                st.session_state["audio_ready"] = True
-            st.success("Audio generation done ✅")
+        if st.button("Generate Audio", key="generate_audio_btn",
+                     disabled=bool(st.session_state.narrate_job_id)):
+            voice_code = LANGUAGE_CODE_MAP[st.session_state["voice_key"]]
+            discard_narration()
+            st.session_state.narrate_job_id = queue.submit(
+                "narrate", {"chunks": st.session_state.chunked_text, "language": voice_code})
+            st.session_state.narrate_error = None
+            st.session_state["audio_ready"] = False
+            st.session_state["final_audio"] = None
+
+        if st.session_state.narrate_job_id:
+            narrate_status()
+        elif st.session_state.narrate_parts:
+            # Same container position and elements as the fragment, so players keep playing
+            with st.container():
+                show_parts({"stage": "done", "parts": st.session_state.narrate_parts})
+        elif st.session_state.narrate_error:
+            st.error(f"Audio generation failed: {st.session_state.narrate_error}")
 
     # -------------------- Audio playback + download (persistent) --------------------
-    if st.session_state.audio_ready and st.session_state.final_audio_file:
+    if st.session_state.audio_ready and st.session_state.final_audio:
         st.divider()
         st.markdown("<b style='font-size:18px;'>🎧 EduNarrator – MP3 Output</b>", unsafe_allow_html=True)
 
-        try:
-            with open(st.session_state.final_audio_file, "rb") as fh:
-                audio_bytes = fh.read()
-
-            st.audio(audio_bytes, format="audio/mp3")
-
-            # download button — will rerun the script BUT state is preserved in st.session_state
-            st.download_button(
-                label="⬇️ Download MP3",
-                data=audio_bytes,
-                file_name="edunarrator_output.mp3",
-                mime="audio/mpeg",
-                key="download_btn",
-            )
-        except FileNotFoundError:
-            st.error("Audio file not found. Please re-generate.")
+        audio_bytes = st.session_state.final_audio
+
+        st.audio(audio_bytes, format="audio/mp3")
+
+        # download button — will rerun the script BUT state is preserved in st.session_state
+        st.download_button(
+            label="⬇️ Download MP3",
+            data=audio_bytes,
+            file_name="edunarrator_output.mp3",
+            mime="audio/mpeg",
+            key="download_btn",
+        )
 
 st.caption("© EduNarrator AI")
@@ -1,47 +1,30 @@
-import os
-import json
-import tempfile
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Iterator, Optional, Union
 from audio_merger import merge_audio_files
-import streamlit as st
+from config import TTS_CONCURRENCY, TTS_MAX_RETRIES
+from retry import call_with_backoff, acall_with_backoff
+from rate_limiter import tts_limiter
+from audio_cache import AudioCache, audio_cache
+from job_store import JobCheckpoint
+from tracing import span, propagate
+from clients import tts_client, tts_async_client
 
 from google.cloud import texttospeech
 from google.adk.agents import Agent
 from google.adk.tools import FunctionTool
 
 
-# Set up Google Cloud credentials from Streamlit secrets
-credentials_data = st.secrets["credentials"]
-if isinstance(credentials_data, str):
-    credentials_dict = json.loads(credentials_data)
-else:
-    credentials_dict = credentials_data
-
-# Write credentials to temporary file
-with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-    json.dump(credentials_dict, temp_file)
-    CREDENTIALS_PATH = temp_file.name
-
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIALS_PATH
-
-
-# Initialize the Text-to-Speech client
-client = texttospeech.TextToSpeechClient()
-
 class NarratorAgent(Agent):
 
-    def synthesize_speech(self,
-        chunks: list[str],
-        gender: str = "NEUTRAL",
-        language: str = "en-US",
-    ) -> bytes:
+    def build_voice(self, gender: str = "NEUTRAL", language: str = "en-US"):
         """
-        Google Cloud Text-to-Speech helper.
+        Builds the Google voice selection and MP3 audio config.
 
-        :param text: Text to synthesize.
         :param gender: One of "MALE", "FEMALE", or "NEUTRAL".
         :param language: BCP-47 language code, e.g. "en-US", "en-GB", "en-NG", "fr-FR".
-        :return: Raw MP3 audio bytes.
         """
 
         # Convert gender text → Google enum
@@ -65,32 +48,182 @@ class NarratorAgent(Agent):
             audio_encoding=texttospeech.AudioEncoding.MP3,
         )
 
-        audio_files = []
+        return voice, audio_config
 
-        for i, text in enumerate(chunks):
-            # print(text)
-            print(f"Generating audio for chunk {i+1}/{len(chunks)}")
+    def stream_speech(self,
+        chunks: list[str],
+        gender: str = "NEUTRAL",
+        language: str = "en-US",
+    ) -> Iterator[bytes]:
+        """
+        Yields the MP3 audio of each chunk, in order, as soon as it is ready.
 
-            synthesis_input = texttospeech.SynthesisInput(text=text)
+        All chunks are submitted up front, so later chunks keep synthesizing
+        while the caller is already playing the earlier ones.
+        """
+        voice, audio_config = self.build_voice(gender, language)
+        total = len(chunks)
+        checkpoint = self._checkpoint(chunks, gender, language, audio_config)
+
+        # Chunk audio is cached by text and voice, so re-running a voice, resuming an
+        # interrupted narration or repeating boilerplate text skips the API call
+        def synthesize(indexed_chunk):
+            i, text = indexed_chunk
+            key = self._cache_key(text, gender, language, audio_config)
+            audio = self._stored_audio(key, checkpoint, i)
+            if audio is None:
+                audio = self.synthesize_chunk(text, voice, audio_config, label=f"{i+1}/{total}")
+                self._store_audio(key, checkpoint, i, audio)
+            return audio
+
+        # Chunks are independent, so keep several requests in flight; map() keeps chunk order
+        pool = ThreadPoolExecutor(max_workers=max(1, TTS_CONCURRENCY))
+        try:
+            yield from pool.map(propagate(synthesize), enumerate(chunks))
+            self._finish_checkpoint(checkpoint)
+        finally:
+            # If the consumer stops early, drop the chunks that have not started yet
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def astream_speech(self,
+        chunks: list[str],
+        gender: str = "NEUTRAL",
+        language: str = "en-US",
+    ) -> AsyncIterator[bytes]:
+        """
+        Async counterpart of stream_speech: every chunk is started as a task on the
+        async TTS client (at most TTS_CONCURRENCY requests in flight) and the audio
+        is yielded in chunk order.
+        """
+        voice, audio_config = self.build_voice(gender, language)
+        total = len(chunks)
+        checkpoint = self._checkpoint(chunks, gender, language, audio_config)
+        semaphore = asyncio.Semaphore(max(1, TTS_CONCURRENCY))
+
+        async def synthesize(i: int, text: str) -> bytes:
+            key = self._cache_key(text, gender, language, audio_config)
+            audio = self._stored_audio(key, checkpoint, i)
+            if audio is None:
+                async with semaphore:
+                    audio = await self.asynthesize_chunk(text, voice, audio_config, label=f"{i+1}/{total}")
+                self._store_audio(key, checkpoint, i, audio)
+            return audio
+
+        tasks = [asyncio.ensure_future(synthesize(i, text)) for i, text in enumerate(chunks)]
+        try:
+            for task in tasks:
+                yield await task
+            self._finish_checkpoint(checkpoint)
+        finally:
+            # If the consumer stops early, cancel the chunks still pending
+            for task in tasks:
+                task.cancel()
+
+    def _cache_key(self, text: str, gender: str, language: str, audio_config) -> str:
+        encoding = texttospeech.AudioEncoding(audio_config.audio_encoding).name
+        return AudioCache.make_key(text, language, gender, encoding)
+
+    # The audio cache may be disabled (TTS_CACHE_PATH="") or evict a long narration's
+    # first chunks before it ends, so each narration also checkpoints its chunks until
+    # it finishes; an interrupted one then resumes either way
+    def _checkpoint(self, chunks: list[str], gender: str, language: str, audio_config) -> JobCheckpoint:
+        encoding = texttospeech.AudioEncoding(audio_config.audio_encoding).name
+        return JobCheckpoint.for_parts([gender.upper(), language, encoding, *chunks])
+
+    def _stored_audio(self, key: str, checkpoint: JobCheckpoint, index: int) -> Optional[bytes]:
+        audio = audio_cache.get(key)
+        return audio if audio is not None else checkpoint.get_bytes("audio", index)
+
+    def _store_audio(self, key: str, checkpoint: JobCheckpoint, index: int, audio: bytes) -> None:
+        audio_cache.set(key, audio)
+        checkpoint.put_bytes("audio", index, audio)
+
+    def _finish_checkpoint(self, checkpoint: JobCheckpoint) -> None:
+        # With the cache on, a repeat narration is served from it; without, the
+        # checkpoint stays (until prune_jobs) so a repeat is still free
+        if audio_cache.enabled:
+            checkpoint.discard()
+
+    def merge_chunk_audio(self, chunk_audio: list[bytes],
+                          output: Union[str, BinaryIO, None] = None) -> Union[str, BinaryIO, bytes]:
+        """
+        Merges the in-memory chunk audio, in order, into one MP3 without writing
+        the chunks to disk. With a path or file object the MP3 is written there
+        and `output` is returned; otherwise the MP3 bytes are returned.
+        """
+        if output is not None:
+            return merge_audio_files(chunk_audio, output)
 
-            response = client.synthesize_speech(
-            input = synthesis_input,
-            voice= voice,
-            audio_config= audio_config)
+        buffer = io.BytesIO()
+        merge_audio_files(chunk_audio, buffer)
+        return buffer.getvalue()
 
-            audio = response.audio_content
-            file_path = f"audio_chunk_{i+1}.mp3"
+    def synthesize_speech(self,
+        chunks: list[str],
+        gender: str = "NEUTRAL",
+        language: str = "en-US",
+    ) -> bytes:
+        """
+        Google Cloud Text-to-Speech helper.
 
-            with open(file_path, "wb") as f:
-                f.write(audio)
-            
-            audio_files.append(file_path)
+        :param chunks: Text chunks to synthesize.
+        :param gender: One of "MALE", "FEMALE", or "NEUTRAL".
+        :param language: BCP-47 language code, e.g. "en-US", "en-GB", "en-NG", "fr-FR".
+        :return: The merged MP3 audio as bytes.
+        """
+        chunk_audio = list(self.stream_speech(chunks, gender, language))
+        return self.merge_chunk_audio(chunk_audio)
 
-        # Merge into 1 file
-        final_audio = merge_audio_files(audio_files, "final_story.mp3")
 
-        return final_audio
+    async def asynthesize_speech(self,
+        chunks: list[str],
+        gender: str = "NEUTRAL",
+        language: str = "en-US",
+    ) -> bytes:
+        """Async counterpart of synthesize_speech; the merge runs in the default executor."""
+        chunk_audio = [audio async for audio in self.astream_speech(chunks, gender, language)]
+        return await asyncio.to_thread(self.merge_chunk_audio, chunk_audio)
 
+    def synthesize_chunk(self, text: str, voice, audio_config, label: str = "") -> bytes:
+        """
+        Synthesizes a single chunk within the shared TTS quota, retrying transient
+        and quota errors with jittered exponential backoff so one failure does not
+        abort the narration.
+        """
+        synthesis_input = texttospeech.SynthesisInput(text=text)
+
+        with span("tts", chunk=label, bytes_in=len(text.encode("utf-8"))) as record:
+            # TTS quota counts requests and input characters; the limiter paces both
+            response = call_with_backoff(
+                tts_limiter().call,
+                tts_client().synthesize_speech,
+                input=synthesis_input,
+                voice=voice,
+                audio_config=audio_config,
+                units=len(text),
+                max_retries=TTS_MAX_RETRIES,
+            )
+            record["bytes_out"] = len(response.audio_content)
+
+        return response.audio_content
+
+    async def asynthesize_chunk(self, text: str, voice, audio_config, label: str = "") -> bytes:
+        """Async counterpart of synthesize_chunk, using the async TTS client."""
+        synthesis_input = texttospeech.SynthesisInput(text=text)
+
+        with span("tts", chunk=label, bytes_in=len(text.encode("utf-8"))) as record:
+            response = await acall_with_backoff(
+                tts_limiter().acall,
+                tts_async_client().synthesize_speech,
+                input=synthesis_input,
+                voice=voice,
+                audio_config=audio_config,
+                units=len(text),
+                max_retries=TTS_MAX_RETRIES,
+            )
+            record["bytes_out"] = len(response.audio_content)
+
+        return response.audio_content
 
    
     def __init__(self):
@@ -0,0 +1,563 @@
+"""
+Offline end-to-end benchmark for the EduVoice pipeline.
+
+Swaps `genai.GenerativeModel` and `texttospeech.TextToSpeechClient` for local
+stand-ins with configurable latency, jitter and error rates, then runs the
+Orchestrator, chunker, NarratorAgent and audio merger over `input_sample/` and
+synthetic large documents. Each document runs in its own process, so its peak
+RSS is its own. Reports per-stage wall time, request counts and peak RSS, and
+can compare against a saved baseline to catch regressions.
+
+Usage (from the repository root):
+    python "Test codes/benchmark_pipeline.py" --pages 500 --output bench.json
+    python "Test codes/benchmark_pipeline.py" --baseline bench.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+# Caches and checkpoints would turn every repeat run into a no-op
+os.environ["LLM_CACHE_PATH"] = ""
+os.environ["JOBS_DIR"] = ""
+os.environ["TTS_CACHE_PATH"] = ""
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+# The fakes have no quota to pace against (0 = unlimited); injected quota errors still
+# exercise the limiters' adaptive concurrency
+for quota in ("GEMINI_RPM", "GEMINI_TPM", "TTS_RPM", "TTS_CHARS_PER_MINUTE"):
+    os.environ.setdefault(quota, "0")
+
+# Every document process imports this script again; keep the deprecation notice out of the report
+warnings.filterwarnings("ignore", message=r"\s*All support for the `google\.generativeai` package", category=FutureWarning)
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.cloud import texttospeech
+
+
+# ==================== 1. Fake Services ====================
+
+class FakeServiceStats:
+    """Thread-safe request counters shared by the fake services."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.errors = {}
+
+    def record(self, name: str, failed: bool = False) -> None:
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            if failed:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests.clear()
+            self.errors.clear()
+
+
+STATS = FakeServiceStats()
+
+
+class FakeLatency:
+    def __init__(self, latency: float, jitter: float, error_rate: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def outcome(self, name: str) -> None:
+        failed = random.random() < self.error_rate
+        STATS.record(name, failed)
+        if failed:
+            raise google_exceptions.ResourceExhausted(f"fake quota error from {name}")
+
+    def wait(self, name: str) -> None:
+        time.sleep(self.delay())
+        self.outcome(name)
+
+    async def await_(self, name: str) -> None:
+        await asyncio.sleep(self.delay())
+        self.outcome(name)
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel that answers every prompt shape the agents use."""
+
+    latency = FakeLatency(0.0, 0.0, 0.0)
+
+    def __init__(self, model_name: str, *args, **kwargs):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+
+    def generate_content(self, contents, *args, **kwargs):
+        self.latency.wait(self.model_name)
+        return self.answer(contents)
+
+    async def generate_content_async(self, contents, *args, **kwargs):
+        await self.latency.await_(self.model_name)
+        return self.answer(contents)
+
+    def answer(self, contents):
+        prompt = contents if isinstance(contents, str) else contents[0]
+        images = 0 if isinstance(contents, str) else len(contents) - 1
+
+        if "JSON array" in prompt:
+            count = max(prompt.count("### Page"), prompt.count("### Image"), images, 1)
+            return FakeResponse(json.dumps([f"Fake summary {i + 1}." for i in range(count)]))
+        if images:
+            return FakeResponse("A simple illustration related to the text.")
+        if "orchestrator" in prompt:
+            return FakeResponse("PdfReaderAgent")
+        return FakeResponse("A short fake summary of the text.")
+
+
+# One MPEG-2 Layer III frame: 24 kHz, mono, 32 kbps, 96 bytes, 24 ms. All-zero side
+# information decodes as silence, so chunks are real MP3 without needing an encoder.
+SILENT_MP3_FRAME = bytes([0xFF, 0xF3, 0x44, 0xC0]) + bytes(92)
+FAKE_SPEECH_CHARS_PER_SECOND = 15
+
+
+class FakeSynthesizeResponse:
+    def __init__(self, audio_content: bytes):
+        self.audio_content = audio_content
+
+
+class FakeTextToSpeechClient:
+    latency = FakeLatency(0.0, 0.0, 0.0)
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def synthesize_speech(self, input=None, voice=None, audio_config=None, **kwargs):
+        self.latency.wait("tts")
+        return self.speech(input.text)
+
+    @staticmethod
+    def speech(text: str) -> FakeSynthesizeResponse:
+        seconds = max(1.0, len(text) / FAKE_SPEECH_CHARS_PER_SECOND)
+        return FakeSynthesizeResponse(SILENT_MP3_FRAME * int(seconds / 0.024))
+
+
+class FakeTextToSpeechAsyncClient(FakeTextToSpeechClient):
+    async def synthesize_speech(self, input=None, voice=None, audio_config=None, **kwargs):
+        await self.latency.await_("tts")
+        return self.speech(input.text)
+
+
+def install_fakes(args) -> None:
+    FakeGenerativeModel.latency = FakeLatency(args.gemini_latency, args.gemini_jitter, args.gemini_error_rate)
+    FakeTextToSpeechClient.latency = FakeLatency(args.tts_latency, args.tts_jitter, args.tts_error_rate)
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.configure = lambda *a, **k: None
+    texttospeech.TextToSpeechClient = FakeTextToSpeechClient
+    texttospeech.TextToSpeechAsyncClient = FakeTextToSpeechAsyncClient
+
+    if not shutil.which("tesseract"):
+        # No OCR engine installed: time rendering + pooling with a fixed per-page cost
+        import pytesseract
+        pytesseract.image_to_string = lambda img: (time.sleep(args.ocr_latency), "Fake OCR text.")[1]
+        print("   ⚠️  tesseract not found, using fake OCR")
+
+
+# ==================== 2. Synthetic Documents ====================
+
+PARAGRAPH = (
+    "The water cycle describes how water evaporates from the surface of the earth, "
+    "rises into the atmosphere, cools and condenses into clouds, and falls again as "
+    "rain or snow. This process shapes weather, climate and life on the planet. "
+)
+
+
+def make_synthetic_pdf(path: str, pages: int, image_every: int = 10) -> None:
+    import fitz
+
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        if number % 20 == 0:
+            page.insert_text((72, 72), f"# Chapter {number // 20 + 1}", fontsize=18)
+        page.insert_textbox(fitz.Rect(72, 100, 540, 500), PARAGRAPH * 4, fontsize=11)
+        if number % image_every == 0:
+            pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 120), False)
+            pix.set_rect(pix.irect, (40 + number % 200, 120, 200))
+            page.insert_image(fitz.Rect(72, 520, 372, 700), pixmap=pix)
+    doc.save(path)
+
+
+def make_synthetic_docx(path: str, paragraphs: int, image_every: int = 25) -> None:
+    import docx
+    from PIL import Image
+
+    image_path = Path(path).with_suffix(".png")
+    Image.new("RGB", (200, 120), (40, 120, 200)).save(image_path)
+
+    document = docx.Document()
+    for number in range(paragraphs):
+        if number % 40 == 0:
+            document.add_heading(f"Chapter {number // 40 + 1}", level=1)
+        document.add_paragraph(PARAGRAPH)
+        if number % image_every == 0:
+            document.add_picture(str(image_path))
+    document.save(path)
+
+
+# ==================== 3. Runner ====================
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process or its largest finished child (ru_maxrss
+    is KiB on Linux). It never goes down, so it is per document only when measured
+    in a process that ran that one document.
+    """
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round(max(own, children) / (1024 * 1024), 1)
+
+
+class StageTimer:
+    def __init__(self, quiet: bool):
+        self.quiet = quiet
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        sink = io.StringIO()
+        with contextlib.redirect_stdout(sink) if self.quiet else contextlib.nullcontext():
+            yield
+        self.stages[name] = round(time.perf_counter() - start, 3)
+
+
+def benchmark_document(path: str, orchestrator, narrator, work_dir: str, args) -> dict:
+    from audio_merger import merge_audio_files
+    from chunker import chunk_text_for_narration
+    from rate_limiter import limiter_stats
+
+    STATS.reset()
+    timer = StageTimer(quiet=not args.verbose)
+    result = {"document": os.path.basename(path), "size_bytes": os.path.getsize(path)}
+
+    try:
+        with timer.stage("route_and_extract"):
+            text = orchestrator.route_task(path)
+        with timer.stage("chunk"):
+            chunks = chunk_text_for_narration(text)
+        if args.max_chunks:
+            chunks = chunks[:args.max_chunks]
+        with timer.stage("narrate"):
+            audio = list(narrator.stream_speech(chunks))
+
+        silence_ms = 300 if shutil.which("ffmpeg") else 0
+        with timer.stage("merge"):
+            merge_audio_files(audio, os.path.join(work_dir, "merged.mp3"), add_silence_ms=silence_ms)
+
+        result.update({"text_chars": len(text), "chunks": len(chunks), "status": "ok"})
+    except Exception as e:
+        result.update({"status": "failed", "error": f"{type(e).__name__}: {e}"})
+
+    result["stages"] = timer.stages
+    result["total_seconds"] = round(sum(timer.stages.values()), 3)
+    result.update(STATS.snapshot())
+    # Concurrency each rate limiter settled at (lowered by injected quota errors)
+    result["limiters"] = limiter_stats()
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def _benchmark_isolated(path: str, work_dir: str, args) -> dict:
+    # Runs in a spawned process: fakes and agents have to be set up again here
+    random.seed(args.seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        install_fakes(args)
+    from orchestrator import Orchestrator
+    from NarratorAgent import NarratorAgent
+    return benchmark_document(path, Orchestrator(), NarratorAgent(), work_dir, args)
+
+
+def benchmark_document_isolated(path: str, work_dir: str, args) -> dict:
+    """Runs benchmark_document() in a fresh process, so `peak_rss_mb` is this document's own peak."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_benchmark_isolated, path, work_dir, args).result()
+
+
+# Run in a fresh interpreter, so nothing is already imported or cached
+COLD_START_SCRIPT = """
+import json, time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+import streamlit, job_queue, worker, tracing
+app = time.perf_counter() - start
+from orchestrator import Orchestrator
+from NarratorAgent import NarratorAgent
+Orchestrator(), NarratorAgent()
+print(json.dumps({"app_import_seconds": round(app, 3),
+                  "worker_ready_seconds": round(time.perf_counter() - start, 3)}))
+"""
+
+
+def measure_cold_start() -> dict:
+    """
+    Times a cold start in a new process: the imports Home.py needs before it can
+    render, and the time until a worker has its agents built. No credentials are
+    needed, since clients are only created on first use.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START_SCRIPT], cwd=REPO_ROOT,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare_extraction(pdf_path: str, workers: int) -> dict:
+    """Times page-range extraction across `workers` processes against the single-process path."""
+    import fitz
+    from pdf_extract import extract_pages
+
+    with fitz.open(pdf_path) as doc:
+        page_numbers = range(doc.page_count)
+
+    start = time.perf_counter()
+    single = extract_pages(pdf_path, page_numbers, workers=1)
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = extract_pages(pdf_path, page_numbers, workers=workers, min_pages_per_worker=1)
+    parallel_seconds = time.perf_counter() - start
+
+    return {
+        "workers": workers,
+        "single_seconds": round(single_seconds, 3),
+        "parallel_seconds": round(parallel_seconds, 3),
+        "speedup": round(single_seconds / parallel_seconds, 2) if parallel_seconds else None,
+        "identical": single == parallel,
+    }
+
+
+def compare_async(documents: list, orchestrator, narrator, copies: int, max_chunks: int) -> dict:
+    """
+    Extracts and narrates `copies` of every document one at a time with the
+    blocking API, then all at once on one event loop with the async API.
+    """
+    from chunker import chunk_text_for_narration
+
+    paths = [path for path in documents for _ in range(copies)]
+
+    def run_one(path: str) -> bytes:
+        chunks = chunk_text_for_narration(orchestrator.route_task(path))
+        return narrator.synthesize_speech(chunks[:max_chunks or None])
+
+    async def arun_one(path: str) -> bytes:
+        chunks = chunk_text_for_narration(await orchestrator.aroute_task(path))
+        return await narrator.asynthesize_speech(chunks[:max_chunks or None])
+
+    async def arun_all() -> list:
+        return await asyncio.gather(*map(arun_one, paths))
+
+    start = time.perf_counter()
+    sequential = [run_one(path) for path in paths]
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    interleaved = asyncio.run(arun_all())
+    async_seconds = time.perf_counter() - start
+
+    return {
+        "documents": len(paths),
+        "sequential_seconds": round(sequential_seconds, 3),
+        "async_seconds": round(async_seconds, 3),
+        "speedup": round(sequential_seconds / async_seconds, 2) if async_seconds else None,
+        "identical": sequential == interleaved,
+    }
+
+
+# Peak RSS growth below this is allocator noise between runs
+RSS_NOISE_MB = 10
+
+
+def successful_requests(result: dict) -> dict:
+    errors = result.get("errors", {})
+    return {name: count - errors.get(name, 0) for name, count in result.get("requests", {}).items()}
+
+
+def compare_with_baseline(results: list, baseline_path: str, tolerance: float) -> list:
+    """
+    Returns a message for every regression against the baseline: a stage or the
+    peak RSS more than `tolerance` above it, or any model (or TTS) answering more
+    requests than before. Failed requests are left out of the count, since
+    injected errors and their retries vary from run to run.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as fh:
+        baseline = {doc["document"]: doc for doc in json.load(fh)["documents"]}
+
+    regressions = []
+    for doc in results:
+        old = baseline.get(doc["document"])
+        if not old:
+            continue
+        for stage, seconds in doc["stages"].items():
+            old_seconds = old["stages"].get(stage)
+            # Ignore sub-50ms stages, where noise dominates
+            if old_seconds and seconds > 0.05 and seconds > old_seconds * (1 + tolerance):
+                regressions.append(f"{doc['document']}: {stage} {old_seconds:.3f}s -> {seconds:.3f}s")
+
+        old_requests, new_requests = successful_requests(old), successful_requests(doc)
+        for name, count in sorted(new_requests.items()):
+            if count > old_requests.get(name, 0):
+                regressions.append(f"{doc['document']}: {name} requests {old_requests.get(name, 0)} -> {count}")
+
+        old_rss = old.get("peak_rss_mb")
+        if old_rss and doc["peak_rss_mb"] > old_rss * (1 + tolerance) and doc["peak_rss_mb"] - old_rss > RSS_NOISE_MB:
+            regressions.append(f"{doc['document']}: peak RSS {old_rss}MB -> {doc['peak_rss_mb']}MB")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline EduVoice pipeline benchmark")
+    parser.add_argument("--inputs", default=str(REPO_ROOT / "input_sample"), help="directory of PDF/DOCX inputs")
+    parser.add_argument("--pages", type=int, default=500, help="pages in the synthetic PDF (0 to skip)")
+    parser.add_argument("--paragraphs", type=int, default=1500, help="paragraphs in the synthetic DOCX (0 to skip)")
+    parser.add_argument("--gemini-latency", type=float, default=0.3)
+    parser.add_argument("--gemini-jitter", type=float, default=0.1)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-latency", type=float, default=0.5)
+    parser.add_argument("--tts-jitter", type=float, default=0.2)
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--ocr-latency", type=float, default=0.2, help="per-page cost of the fake OCR")
+    parser.add_argument("--max-chunks", type=int, default=0, help="narrate at most this many chunks per document")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare stage times, request counts and RSS against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown and RSS growth vs baseline (0.25 = 25%%)")
+    parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for the page-range extraction comparison on the synthetic PDF (1 to skip)")
+    parser.add_argument("--cold-start-budget", type=float, default=1.0,
+                        help="maximum seconds for Home.py's imports in a fresh process (0 to skip the check)")
+    parser.add_argument("--async-copies", type=int, default=2,
+                        help="copies of each input document for the blocking vs async comparison (0 to skip)")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline prints")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    print("=" * 60)
+    print("EduVoice offline benchmark")
+    print("=" * 60)
+
+    install_fakes(args)
+
+    import_start = time.perf_counter()
+    from orchestrator import Orchestrator
+    from NarratorAgent import NarratorAgent
+    orchestrator = Orchestrator()
+    narrator = NarratorAgent()
+    cold_start = round(time.perf_counter() - import_start, 3)
+    print(f"\nCold start (imports + agent construction): {cold_start:.2f}s")
+
+    fresh_start = measure_cold_start()
+    print(f"Fresh process: app imports {fresh_start['app_import_seconds']:.2f}s, "
+          f"worker ready {fresh_start['worker_ready_seconds']:.2f}s")
+
+    extraction = None
+    with tempfile.TemporaryDirectory() as work_dir:
+        documents = sorted(
+            str(p) for p in Path(args.inputs).iterdir() if p.suffix.lower() in (".pdf", ".docx")
+        )
+        samples = list(documents)
+        if args.pages:
+            synthetic_pdf = os.path.join(work_dir, f"synthetic_{args.pages}_pages.pdf")
+            make_synthetic_pdf(synthetic_pdf, args.pages)
+            documents.append(synthetic_pdf)
+
+            if args.extract_workers > 1:
+                extraction = compare_extraction(synthetic_pdf, args.extract_workers)
+                print(f"Page-range extraction: 1 process {extraction['single_seconds']:.2f}s, "
+                      f"{extraction['workers']} processes {extraction['parallel_seconds']:.2f}s "
+                      f"(x{extraction['speedup']}, identical={extraction['identical']})")
+        if args.paragraphs:
+            synthetic_docx = os.path.join(work_dir, f"synthetic_{args.paragraphs}_paragraphs.docx")
+            make_synthetic_docx(synthetic_docx, args.paragraphs)
+            documents.append(synthetic_docx)
+
+        results = []
+        for path in documents:
+            doc_dir = tempfile.mkdtemp(dir=work_dir)
+            result = benchmark_document_isolated(path, doc_dir, args)
+            results.append(result)
+
+            icon = "✅" if result["status"] == "ok" else "❌"
+            stages = "  ".join(f"{name}={seconds:.2f}s" for name, seconds in result["stages"].items())
+            print(f"\n{icon} {result['document']}  total={result['total_seconds']:.2f}s  rss={result['peak_rss_mb']}MB")
+            print(f"   {stages}")
+            print(f"   requests={result['requests']}  errors={result['errors']}")
+            limits = {name: stats["limit"] for name, stats in result["limiters"].items()}
+            print(f"   concurrency={limits}")
+            if result["status"] != "ok":
+                print(f"   {result['error']}")
+
+        async_api = None
+        if args.async_copies and samples and not shutil.which("ffmpeg"):
+            # synthesize_speech inserts silence between chunks, which needs ffmpeg
+            print("\n   ⚠️  ffmpeg not found, skipping the async API comparison")
+        elif args.async_copies and samples:
+            async_api = compare_async(samples, orchestrator, narrator, args.async_copies, args.max_chunks)
+            print(f"\nAsync API, {async_api['documents']} documents: one at a time {async_api['sequential_seconds']:.2f}s, "
+                  f"interleaved {async_api['async_seconds']:.2f}s "
+                  f"(x{async_api['speedup']}, identical={async_api['identical']})")
+
+    report = {"cold_start_seconds": cold_start, "fresh_start": fresh_start, "extraction": extraction,
+              "async_api": async_api, "settings": vars(args), "documents": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.cold_start_budget and fresh_start["app_import_seconds"] > args.cold_start_budget:
+        print(f"\n❌ App cold start {fresh_start['app_import_seconds']:.2f}s exceeds "
+              f"the {args.cold_start_budget:.2f}s budget")
+        return 1
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Regressions against baseline:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print("\n✅ No regressions against baseline")
+
+    return 0 if all(doc["status"] == "ok" for doc in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
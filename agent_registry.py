@@ -0,0 +1,83 @@
+import os
+import zipfile
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+# ==================== 1. File Type Detection ====================
+
+def is_pdf(file_path: str) -> bool:
+    """Checks for the '%PDF' signature at the start of the file."""
+    try:
+        with open(file_path, "rb") as fh:
+            return fh.read(1024).lstrip().startswith(b"%PDF")
+    except OSError:
+        return False
+
+
+def is_docx(file_path: str) -> bool:
+    """Checks for the 'PK' zip header and a 'word/document.xml' part inside the archive."""
+    try:
+        with open(file_path, "rb") as fh:
+            if fh.read(4) != b"PK\x03\x04":
+                return False
+        with zipfile.ZipFile(file_path) as archive:
+            archive.getinfo("word/document.xml")
+        return True
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return False
+
+
+# ==================== 2. Registry ====================
+
+@dataclass
+class AgentRoute:
+    name: str
+    handler: Callable[[str], str]
+    extensions: Tuple[str, ...] = ()
+    sniff: Optional[Callable[[str], bool]] = None
+    # Coroutine version of handler; without one, async routing runs handler in a thread
+    async_handler: Optional[Callable[[str], Awaitable[str]]] = None
+
+
+class AgentRegistry:
+    """
+    Maps files to the agent that should process them without any network call.
+    Content signatures are checked first, then the file extension.
+    """
+
+    def __init__(self):
+        self._routes: List[AgentRoute] = []
+
+    def register(self, name: str, handler: Callable[[str], str],
+                 extensions: Tuple[str, ...] = (), sniff: Optional[Callable[[str], bool]] = None,
+                 async_handler: Optional[Callable[[str], Awaitable[str]]] = None) -> None:
+        """Registers (or replaces) the agent `name` for the given extensions and content check."""
+        self._routes = [route for route in self._routes if route.name != name]
+        self._routes.append(AgentRoute(
+            name=name,
+            handler=handler,
+            extensions=tuple(ext.lower() for ext in extensions),
+            sniff=sniff,
+            async_handler=async_handler,
+        ))
+
+    def names(self) -> List[str]:
+        return [route.name for route in self._routes]
+
+    def get(self, name: str) -> Optional[AgentRoute]:
+        for route in self._routes:
+            if route.name == name:
+                return route
+        return None
+
+    def resolve(self, file_path: str) -> Optional[AgentRoute]:
+        """Returns the route for the file, or None if no registered agent recognises it."""
+        for route in self._routes:
+            if route.sniff and route.sniff(file_path):
+                return route
+
+        extension = os.path.splitext(file_path)[1].lower()
+        for route in self._routes:
+            if extension and extension in route.extensions:
+                return route
+        return None
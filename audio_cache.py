@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from config import TTS_CACHE_PATH, TTS_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class AudioCache:
+    """
+    Persistent cache of synthesized chunk audio.
+
+    Entries are keyed by a hash of the chunk text plus the language code, voice
+    gender and audio encoding, so the same sentence read by the same voice is
+    only paid for once across narrations and documents (chapter headings,
+    copyright pages, re-running a voice already tried). Audio is stored in
+    SQLite and the least recently used entries are evicted once the total size
+    exceeds `max_bytes`. Like the LLM cache, a read or write that fails (e.g. a
+    lock held too long by another worker) is logged and treated as a miss.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 500 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Chunks are synthesized from a thread pool, so one connection is shared behind a lock
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            # Queue workers and batch processes share the file; WAL lets them read while one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS audio ("
+                " key TEXT PRIMARY KEY,"
+                " audio BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_audio_last_used ON audio(last_used)")
+            self._conn.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    @staticmethod
+    def make_key(text: str, language: str, gender: str, encoding: str) -> str:
+        """Builds the cache key from the chunk text, language code, voice gender and audio encoding."""
+        digest = hashlib.sha256()
+        for part in (text, language, gender.upper(), encoding.upper()):
+            digest.update(part.encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached audio, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT audio FROM audio WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                self._conn.execute("UPDATE audio SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self._conn.rollback()
+                logger.warning("Audio cache read failed, treating as a miss: %s", e)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, audio: bytes) -> None:
+        """Stores chunk audio and evicts least recently used entries beyond `max_bytes`."""
+        if not self.enabled or not audio:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO audio (key, audio, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, sqlite3.Binary(audio), len(audio), now, now),
+                )
+                self._evict()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self._conn.rollback()
+                logger.warning("Audio cache write failed, audio not cached: %s", e)
+
+    def _evict(self) -> None:
+        if self.max_bytes:
+            # Keep the most recently used entries whose sizes add up to at most max_bytes
+            self._conn.execute(
+                "DELETE FROM audio WHERE key IN ("
+                " SELECT key FROM ("
+                "  SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS running FROM audio)"
+                " WHERE running > ?)",
+                (self.max_bytes,),
+            )
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters plus the number and total size of stored entries."""
+        entries, total_bytes = 0, 0
+        if self.enabled:
+            with self._lock:
+                entries, total_bytes = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio"
+                ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total_bytes}
+
+    def clear(self) -> None:
+        if self.enabled:
+            with self._lock:
+                self._conn.execute("DELETE FROM audio")
+                self._conn.commit()
+
+
+# Shared by every narration in the process
+audio_cache = AudioCache(TTS_CACHE_PATH, TTS_CACHE_MAX_BYTES)
@@ -1,27 +1,189 @@
 #pydub needs fmpeg to be installed in the OS
+import contextlib
+import io
+import os
+import subprocess
+import tempfile
+from typing import BinaryIO, Optional, Tuple, Union
+
 from pydub import AudioSegment
+from pydub.utils import get_encoder_name
+
+from tracing import span
+
+# Copy chunks to the output in blocks of this size, so memory stays constant
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# MPEG audio sample rates indexed by [version bits][sample-rate bits]
+MP3_SAMPLE_RATES = {
+    0b11: (44100, 48000, 32000),  # MPEG-1
+    0b10: (22050, 24000, 16000),  # MPEG-2
+    0b00: (11025, 12000, 8000),   # MPEG-2.5
+}
 
 
-def merge_audio_files(audio_chunks: list, output_path: str, add_silence_ms: int = 300):
+def merge_audio_files(audio_chunks: list, output_path: Union[str, os.PathLike, BinaryIO], add_silence_ms: int = 300):
     """
-    Merges multiple audio chunks into a single audio file.
-    - audio_chunks: list of file paths in correct order
+    Merges multiple audio chunks into a single audio file in one streaming pass.
+    - audio_chunks: file paths or in-memory MP3 bytes, in correct order
+    - output_path: output file path (str or os.PathLike), or a writable binary file object (MP3 output only)
     - add_silence_ms: silence between chunks (default: 0.3 sec)
+
+    MP3 chunks going to an MP3 output are concatenated frame by frame without
+    decoding, with the silence gap spliced in as pre-encoded frames. Any other
+    combination is handed to a single ffmpeg concat invocation.
     """
 
     if not audio_chunks:
         raise ValueError("No audio chunks provided")
 
-    final_audio = AudioSegment.silent(duration=0)
+    all_mp3 = all(_is_bytes(chunk) or str(chunk).lower().endswith(".mp3") for chunk in audio_chunks)
+    # Paths (str or pathlib.Path) are written by name; anything else is a file object
+    path = os.fspath(output_path) if isinstance(output_path, (str, os.PathLike)) else None
+    mp3_output = path is None or path.lower().endswith(".mp3")
+    with span("merge", chunks=len(audio_chunks), frame_copy=all_mp3) as record:
+        if all_mp3 and mp3_output:
+            record["bytes_out"] = _concat_mp3_frames(audio_chunks, output_path if path is None else path, add_silence_ms)
+        elif path is not None:
+            _concat_with_ffmpeg(audio_chunks, path, add_silence_ms)
+            record["bytes_out"] = os.path.getsize(path)
+        else:
+            raise ValueError("Only MP3 chunks can be merged into a file object")
+
+    return output_path
 
-    silence = AudioSegment.silent(duration=add_silence_ms)
 
-    print("Files passed to merger: ")
+# ==================== MP3 frame-level concatenation ====================
 
-    for chunk_path in audio_chunks:
-        segment = AudioSegment.from_file(chunk_path)
-        final_audio += segment + silence
+# A chunk is either a path to an MP3 file or the MP3 bytes themselves
 
-    final_audio.export(output_path, format=output_path.split(".")[-1])
+def _is_bytes(chunk) -> bool:
+    return isinstance(chunk, (bytes, bytearray, memoryview))
 
-    return output_path
+
+def _chunk_size(chunk) -> int:
+    return len(chunk) if _is_bytes(chunk) else os.path.getsize(chunk)
+
+
+def _read_at(chunk, offset: int, length: int) -> bytes:
+    if _is_bytes(chunk):
+        return bytes(chunk[offset:offset + length])
+    with open(chunk, "rb") as fh:
+        fh.seek(offset)
+        return fh.read(length)
+
+
+def _id3v2_size(header: bytes) -> int:
+    """Returns the length of a leading ID3v2 tag, or 0 if there is none."""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    has_footer = header[5] & 0x10
+    return 10 + size + (10 if has_footer else 0)
+
+
+def _mp3_audio_range(chunk) -> Tuple[int, int]:
+    """Returns the (start, end) byte range of the MPEG frames, skipping ID3v2/ID3v1 tags."""
+    size = _chunk_size(chunk)
+    start = _id3v2_size(_read_at(chunk, 0, 10))
+    end = size
+    if size - start >= 128 and _read_at(chunk, size - 128, 3) == b"TAG":
+        end = size - 128
+    return start, end
+
+
+def _mp3_format(chunk) -> Optional[Tuple[int, int]]:
+    """Reads (sample_rate, channels) from the first MPEG frame header."""
+    start, _ = _mp3_audio_range(chunk)
+    data = _read_at(chunk, start, 64 * 1024)
+
+    for i in range(len(data) - 3):
+        if data[i] != 0xFF or (data[i + 1] & 0xE0) != 0xE0:
+            continue
+        version = (data[i + 1] >> 3) & 0b11
+        rate_index = (data[i + 2] >> 2) & 0b11
+        if version not in MP3_SAMPLE_RATES or rate_index == 0b11:
+            continue
+        channels = 1 if (data[i + 3] >> 6) == 0b11 else 2
+        return MP3_SAMPLE_RATES[version][rate_index], channels
+    return None
+
+
+def _encoded_mp3_silence(duration_ms: int, sample_rate: int, channels: int) -> bytes:
+    """Encodes a silence gap once, as bare MPEG frames matching the chunk format."""
+    buffer = io.BytesIO()
+    silence = AudioSegment.silent(duration=duration_ms, frame_rate=sample_rate).set_channels(channels)
+    silence.export(buffer, format="mp3", parameters=["-write_xing", "0", "-id3v2_version", "0"])
+    data = buffer.getvalue()
+    return data[_id3v2_size(data[:10]):]
+
+
+def _copy_range(chunk, dst, start: int, end: int) -> None:
+    if _is_bytes(chunk):
+        dst.write(memoryview(chunk)[start:end])
+        return
+    with open(chunk, "rb") as src:
+        src.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = src.read(min(COPY_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            dst.write(block)
+            remaining -= len(block)
+
+
+def _concat_mp3_frames(audio_chunks: list, output: Union[str, BinaryIO], add_silence_ms: int) -> int:
+    """Writes the frames of every chunk (plus silence) to `output` and returns the bytes written."""
+    silence = b""
+    if add_silence_ms > 0:
+        fmt = _mp3_format(audio_chunks[0])
+        if fmt:
+            silence = _encoded_mp3_silence(add_silence_ms, *fmt)
+
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(output, "wb")) if isinstance(output, str) else output
+        written = 0
+        for chunk in audio_chunks:
+            start, end = _mp3_audio_range(chunk)
+            _copy_range(chunk, out, start, end)
+            out.write(silence)
+            written += end - start + len(silence)
+    return written
+
+
+# ==================== ffmpeg concat (other formats) ====================
+
+def _concat_with_ffmpeg(audio_chunks: list, output_path: str, add_silence_ms: int) -> None:
+    with tempfile.TemporaryDirectory() as work_dir:
+        # ffmpeg reads files, so in-memory chunks are spilled to the work dir
+        entries = []
+        for i, chunk in enumerate(audio_chunks):
+            path = chunk
+            if _is_bytes(chunk):
+                path = os.path.join(work_dir, f"chunk_{i}.mp3")
+                with open(path, "wb") as fh:
+                    fh.write(chunk)
+            entries.append(os.path.abspath(path))
+        input_ext = os.path.splitext(entries[0])[1].lstrip(".") or "mp3"
+
+        if add_silence_ms > 0:
+            # Only the first chunk is decoded, to match the silence to its format
+            first = AudioSegment.from_file(entries[0])
+            silence_path = os.path.join(work_dir, f"silence.{input_ext}")
+            AudioSegment.silent(duration=add_silence_ms, frame_rate=first.frame_rate) \
+                .set_channels(first.channels) \
+                .export(silence_path, format=input_ext)
+            entries = [path for entry in entries for path in (entry, silence_path)]
+
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, "w", encoding="utf-8") as fh:
+            for path in entries:
+                escaped = path.replace("'", "'\\''")
+                fh.write(f"file '{escaped}'\n")
+
+        subprocess.run(
+            [get_encoder_name(), "-y", "-loglevel", "error",
+             "-f", "concat", "-safe", "0", "-i", list_path, "-vn", output_path],
+            check=True,
+        )
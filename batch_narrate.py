@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import BATCH_OUTPUT_DIR, BATCH_WORKERS
+from job_store import file_content_hash
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_EXTENSIONS = (".pdf", ".docx")
+MANIFEST_NAME = "manifest.json"
+
+# A skipped document keeps the record of the run that produced its outputs
+OK, SKIPPED, FAILED = "ok", "skipped", "failed"
+
+
+# ==================== 1. Inputs ====================
+
+def collect_documents(source: str, gender: str, language: str) -> List[Dict[str, Any]]:
+    """
+    Lists the documents to narrate, in a stable order.
+
+    `source` is either a directory, searched recursively for PDF and DOCX files,
+    or a manifest: a text file with one path per line ('#' starts a comment), or a
+    JSON list of paths or of {"path", "gender", "language"} objects. Relative
+    paths in a manifest are resolved against the manifest's directory; a path
+    listed more than once is narrated once.
+    """
+    if os.path.isdir(source):
+        root = os.path.abspath(source)
+        paths = sorted(
+            str(path) for path in Path(root).rglob("*")
+            if path.suffix.lower() in DOCUMENT_EXTENSIONS and not path.name.startswith((".", "~$"))
+        )
+        entries: List[Dict[str, Any]] = [{"path": path} for path in paths]
+    else:
+        root = os.path.dirname(os.path.abspath(source))
+        with open(source, "r", encoding="utf-8") as fh:
+            content = fh.read()
+        if source.lower().endswith(".json"):
+            entries = [item if isinstance(item, dict) else {"path": item} for item in json.loads(content)]
+        else:
+            lines = (line.split("#", 1)[0].strip() for line in content.splitlines())
+            entries = [{"path": line} for line in lines if line]
+
+    documents = []
+    for entry in entries:
+        path = os.path.normpath(os.path.join(root, os.path.expanduser(entry["path"])))
+        relative = os.path.relpath(path, root)
+        if relative.startswith(os.pardir):
+            # Files outside the source root are written flat, under their own name plus a
+            # short hash of their location, so a/ch1.pdf and b/ch1.pdf never share outputs
+            location = hashlib.sha256(path.encode("utf-8")).hexdigest()[:8]
+            stem, extension = os.path.splitext(os.path.basename(path))
+            name = f"{stem}-{location}{extension}"
+        else:
+            name = relative
+        documents.append({
+            "source": path,
+            # "book.pdf" -> "book.pdf.mp3", so book.pdf and book.docx never share an output
+            "name": name,
+            "gender": entry.get("gender", gender),
+            "language": entry.get("language", language),
+        })
+    # The same file listed twice would be narrated twice into the same outputs
+    seen = set()
+    unique = []
+    for document in documents:
+        if document["name"] in seen:
+            logger.warning("Skipping duplicate entry %s", document["source"])
+            continue
+        seen.add(document["name"])
+        unique.append(document)
+    return unique
+
+
+def load_manifest(output_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Records of the previous run in `output_dir`, keyed by document name."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), "r", encoding="utf-8") as fh:
+            return {record["name"]: record for record in json.load(fh)["documents"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def is_up_to_date(document: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> bool:
+    """True if the previous run narrated the same content with the same voice and its outputs still exist."""
+    return bool(
+        previous
+        and previous.get("status") in (OK, SKIPPED)
+        and previous.get("source_hash") == document["source_hash"]
+        and previous.get("gender") == document["gender"]
+        and previous.get("language") == document["language"]
+        and all(os.path.isfile(previous.get(key) or "") for key in ("audio_path", "text_path"))
+    )
+
+
+# ==================== 2. Per-document job (runs in a pool process) ====================
+
+def narrate_document(document: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+    """
+    Extracts, chunks and narrates one document, writing `<name>.mp3` and `<name>.txt`
+    under `output_dir`. Returns its manifest record; errors are recorded, not raised,
+    so one broken file does not stop the batch.
+    """
+    # Agents are built once per pool process and reused for every document it gets
+    from chunker import chunk_text_for_narration
+    from worker import get_narrator, get_orchestrator, write_atomic
+
+    record = {**document, "status": FAILED, "seconds": {}}
+    audio_path = os.path.join(output_dir, document["name"] + ".mp3")
+    text_path = os.path.join(output_dir, document["name"] + ".txt")
+    os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+
+    def timed(stage: str, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record["seconds"][stage] = round(time.perf_counter() - start, 3)
+
+    try:
+        narrator = get_narrator()
+        text = timed("extract", get_orchestrator().route_task, document["source"])
+        write_atomic(text_path, text.encode("utf-8"))
+        chunks = timed("chunk", chunk_text_for_narration, text)
+        chunk_audio = timed("narrate", lambda: list(narrator.stream_speech(
+            chunks, gender=document["gender"], language=document["language"])))
+        audio = timed("merge", narrator.merge_chunk_audio, chunk_audio)
+        write_atomic(audio_path, audio)
+        record.update({
+            "status": OK,
+            "audio_path": audio_path,
+            "text_path": text_path,
+            "text_chars": len(text),
+            "chunks": len(chunks),
+            "audio_bytes": len(audio),
+        })
+    except Exception as e:
+        logger.exception("Narrating %s failed", document["source"])
+        record["error"] = f"{type(e).__name__}: {e}"
+
+    record["seconds"]["total"] = round(sum(record["seconds"].values()), 3)
+    return record
+
+
+# ==================== 3. Batch runner ====================
+
+def write_manifest(output_dir: str, manifest: Dict[str, Any]) -> str:
+    """Writes the manifest atomically, so an interrupted batch still leaves a readable one."""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_batch(documents: List[Dict[str, Any]], output_dir: str, workers: int = BATCH_WORKERS,
+              force: bool = False) -> Dict[str, Any]:
+    """
+    Narrates every document that is not already up to date, `workers` documents at
+    a time in separate processes, and writes `manifest.json` to `output_dir` after
+    each document finishes. Totals count this batch only. Returns the manifest.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    output_dir = os.path.abspath(output_dir)
+    previous = load_manifest(output_dir)
+    started = time.perf_counter()
+
+    records: Dict[str, Dict[str, Any]] = {}
+    todo = []
+    for document in documents:
+        try:
+            document["source_hash"] = file_content_hash(document["source"])
+        except OSError as e:
+            records[document["name"]] = {**document, "status": FAILED, "error": f"{type(e).__name__}: {e}"}
+            continue
+        if not force and is_up_to_date(document, previous.get(document["name"])):
+            records[document["name"]] = {**previous[document["name"]], "status": SKIPPED}
+        else:
+            todo.append(document)
+
+    manifest = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "output_dir": output_dir,
+        "workers": workers,
+        "documents": [],
+        "totals": {},
+    }
+
+    # Outputs of earlier batches into the same directory stay listed (after this batch's documents)
+    names = {document["name"] for document in documents}
+    carried = [record for name, record in previous.items() if name not in names]
+
+    def save() -> None:
+        current = [records[doc["name"]] for doc in documents if doc["name"] in records]
+        manifest["documents"] = current + carried
+        statuses = [record["status"] for record in current]
+        manifest["totals"] = {
+            "documents": len(documents),
+            "narrated": statuses.count(OK),
+            "skipped": statuses.count(SKIPPED),
+            "failed": statuses.count(FAILED),
+            "pending": len(documents) - len(statuses),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        write_manifest(output_dir, manifest)
+
+    logger.info("%d documents: %d to narrate, %d up to date", len(documents), len(todo),
+                sum(record["status"] == SKIPPED for record in records.values()))
+    save()
+    if not todo:
+        return manifest
+
+    # Pool processes share the Gemini/TTS quotas, like queue workers do
+    workers = max(1, min(workers, len(todo)))
+    os.environ.setdefault("RATE_LIMIT_PROCESSES", str(workers))
+    # Spawned (not forked) and non-daemonic, so each document can still start its OCR/extraction pools
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(narrate_document, document, output_dir): document for document in todo}
+        for done, future in enumerate(as_completed(futures), 1):
+            document = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                # The pool process itself died (e.g. out of memory)
+                record = {**document, "status": FAILED, "error": f"{type(e).__name__}: {e}"}
+            records[document["name"]] = record
+            logger.info("[%d/%d] %s %s (%.1fs)", done, len(todo), record["status"], document["name"],
+                        record.get("seconds", {}).get("total", 0.0))
+            save()
+    return manifest
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Narrate every PDF/DOCX in a directory or manifest.")
+    parser.add_argument("source", help="directory of documents, or a manifest (.txt: one path per line; .json: list)")
+    parser.add_argument("--output-dir", default=BATCH_OUTPUT_DIR,
+                        help="where the MP3/text outputs and manifest.json go (default: BATCH_OUTPUT_DIR)")
+    parser.add_argument("--workers", type=int, default=max(1, BATCH_WORKERS),
+                        help="documents processed in parallel, one process each (default: BATCH_WORKERS)")
+    parser.add_argument("--gender", default="NEUTRAL", choices=("MALE", "FEMALE", "NEUTRAL"))
+    parser.add_argument("--language", default="en-US", help="BCP-47 voice language, e.g. en-US, en-IN, hi-IN")
+    parser.add_argument("--force", action="store_true", help="narrate every document, even if up to date")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    documents = collect_documents(args.source, args.gender, args.language)
+    manifest = run_batch(documents, args.output_dir, args.workers, args.force)
+
+    totals = manifest["totals"]
+    logger.info("Narrated %d, skipped %d, failed %d in %.1fs; manifest: %s",
+                totals["narrated"], totals["skipped"], totals["failed"], totals["seconds"],
+                os.path.join(manifest["output_dir"], MANIFEST_NAME))
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,88 +1,212 @@
 import re
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional
+
+from tracing import span
 
 # --- Configuration ---
-# Set a safe limit for TTS APIs. Using 4500 characters to be safely under 
-# common 5000 character limits, ensuring full text fits in the request.
-MAX_TTS_CHUNK_CHARACTERS = 4500
+# Google Text-to-Speech limits each request to 5000 *bytes* of input, not characters.
+# Devanagari and most non-Latin scripts take 2-3 bytes per character in UTF-8, so
+# chunks are packed by encoded size, with a small margin under the hard limit.
+MAX_TTS_CHUNK_BYTES = 4800
+
+# The first chunk is kept short so its audio comes back quickly and playback
+# can start while the rest of the document is still being synthesized.
+FIRST_TTS_CHUNK_BYTES = 600
+
+# Sentence terminators: Latin (.!?), Devanagari danda/double danda (। ॥),
+# Arabic/Urdu question mark and full stop (؟ ۔) and CJK full-width marks (。！？).
+# CJK text has no space after a sentence, so those marks end a sentence on their own.
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?।॥؟۔])\s+|(?<=[。！？])\s*")
+
+WHITESPACE = re.compile(r"\s+")
+
+PARAGRAPH_SEPARATOR = "\n\n"
+
 
-def chunk_text_for_narration(full_text: str) -> List[str]:
+def utf8_len(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+def chunk_text_for_narration(full_text: str, first_chunk_limit: Optional[int] = None) -> List[str]:
     """
-    Takes a single string of text and divides it into smaller, coherent chunks 
+    Takes a single string of text and divides it into smaller, coherent chunks
     suitable for a Text-to-Speech (TTS) API, prioritizing paragraph breaks.
-    
+
     Args:
         full_text (str): The entire document content as a single string.
-        
+        first_chunk_limit (Optional[int]): If set, the first chunk is cut at a
+            sentence boundary to at most this many UTF-8 bytes (progressive playback).
+
     Returns:
-        List[str]: A list of text chunks, each guaranteed to be under the 
-                   MAX_TTS_CHUNK_CHARACTERS limit.
+        List[str]: A list of text chunks, each guaranteed to be under the
+                   MAX_TTS_CHUNK_BYTES limit once encoded as UTF-8.
     """
     if not full_text.strip():
         return ["Document text is empty."]
 
-    # 1. Split the text into major sections (paragraphs)
-    # We use '\n\n' as the primary delimiter for semantic breaks.
-    paragraphs = [p.strip() for p in full_text.split('\n\n') if p.strip()]
-    
-    tts_chunks = []
-    current_chunk = ""
-    
-    for paragraph in paragraphs:
-        
-        # Check if adding the new paragraph exceeds the total allowed length
-        # We add 2 to account for the necessary '\n\n' separator.
-        if len(current_chunk) + len(paragraph) + 2 > MAX_TTS_CHUNK_CHARACTERS:
-            
-            # Current chunk is full. Save it.
-            if current_chunk.strip():
-                tts_chunks.append(current_chunk.strip())
-            
-            # Start a new chunk with the current paragraph.
-            current_chunk = paragraph + "\n\n"
-            
-            # CRITICAL: Handle the case where a single paragraph is too long.
-            if len(paragraph) > MAX_TTS_CHUNK_CHARACTERS:
-                sub_chunks = split_oversized_paragraph_by_sentence(paragraph)
-                tts_chunks.extend(sub_chunks)
-                current_chunk = "" # Reset, as the oversized paragraph was handled.
-        
-        else:
-            # Add the paragraph to the current chunk
-            current_chunk += paragraph + "\n\n"
-            
-    # Add the final remaining chunk
-    if current_chunk.strip():
-        tts_chunks.append(current_chunk.strip())
+    with span("chunk", bytes_in=utf8_len(full_text)) as record:
+        tts_chunks = list(iter_narration_chunks([full_text], first_chunk_limit=first_chunk_limit))
+        record["chunks"] = len(tts_chunks)
 
-    print("\n-----------total chunks -----------------\n")
-    print(len(tts_chunks))
-        
     return tts_chunks
 
-def split_oversized_paragraph_by_sentence(paragraph: str) -> List[str]:
+
+def iter_narration_chunks(text_stream: Iterable[str], max_bytes: int = MAX_TTS_CHUNK_BYTES,
+                          first_chunk_limit: Optional[int] = None) -> Iterator[str]:
     """
-    Splits an extremely long paragraph into smaller sub-chunks by sentence, 
-    used only as a fallback when paragraph chunking fails the size check.
+    Generator version of the chunker: consumes text as it arrives (in pieces of
+    any size) and yields each chunk as soon as it is full. Whole paragraphs are
+    packed up to `max_bytes`; when the next paragraph does not fit, the remaining
+    room is filled sentence by sentence so every request is close to the limit.
     """
-    # Split by sentence punctuation followed by space
-    sentences = re.split(r'(?<=[.!?])\s+', paragraph) 
-    
-    sub_chunks = []
-    current_sub_chunk = ""
-    for sentence in sentences:
-        if len(current_sub_chunk) + len(sentence) + 1 > MAX_TTS_CHUNK_CHARACTERS:
-            # Sub-chunk is full, save it
-            sub_chunks.append(current_sub_chunk.strip())
-            current_sub_chunk = sentence + " "
+    current: List[str] = []
+    current_bytes = 0
+    first_pending = bool(first_chunk_limit)
+    limit = first_chunk_limit or max_bytes
+
+    def emit(chunk: str) -> Iterator[str]:
+        nonlocal first_pending
+        if not chunk:
+            return
+        if first_pending and utf8_len(chunk) > first_chunk_limit:
+            yield from split_first_chunk([chunk], first_chunk_limit)
+        else:
+            yield chunk
+        first_pending = False
+
+    for paragraph in iter_paragraphs(text_stream):
+        separator = PARAGRAPH_SEPARATOR if current else ""
+
+        if current_bytes + utf8_len(separator + paragraph) <= limit:
+            pieces = [separator + paragraph]
         else:
-            current_sub_chunk += sentence + " "
-    
-    # Add the final sub-chunk
-    if current_sub_chunk.strip():
-        sub_chunks.append(current_sub_chunk.strip())
-        
-    return sub_chunks
-
-    
-    
+            # The paragraph does not fit whole: fill the remaining room sentence by sentence
+            pieces = _sentence_pieces(paragraph, max_bytes)
+            pieces[0] = separator + pieces[0]
+
+        for piece in pieces:
+            piece_bytes = utf8_len(piece)
+            if current and current_bytes + piece_bytes > limit:
+                # Current chunk is full. Save it.
+                yield from emit("".join(current).strip())
+                current, current_bytes, limit = [], 0, max_bytes
+                piece = piece.lstrip()
+                piece_bytes = utf8_len(piece)
+            current.append(piece)
+            current_bytes += piece_bytes
+
+    # Add the final remaining chunk
+    yield from emit("".join(current).strip())
+
+
+def iter_paragraphs(text_stream: Iterable[str]) -> Iterator[str]:
+    """
+    Splits a stream of text pieces on blank lines ('\\n\\n') and yields each
+    non-empty paragraph once it is complete. Pieces are only joined when a
+    paragraph ends, so long inputs are not rebuilt over and over.
+    """
+    buffer: List[str] = []
+    for piece in text_stream:
+        if not piece:
+            continue
+        crosses_break = bool(buffer) and buffer[-1].endswith("\n") and piece.startswith("\n")
+        if PARAGRAPH_SEPARATOR not in piece and not crosses_break:
+            buffer.append(piece)
+            continue
+
+        *complete, rest = ("".join(buffer) + piece).split(PARAGRAPH_SEPARATOR)
+        buffer = [rest]
+        for paragraph in complete:
+            if paragraph.strip():
+                yield paragraph.strip()
+
+    tail = "".join(buffer).strip()
+    if tail:
+        yield tail
+
+
+def _split_keeping_text(text: str, boundary: re.Pattern) -> List[str]:
+    """Splits after each boundary match; concatenating the pieces gives back `text`."""
+    pieces = []
+    start = 0
+    for match in boundary.finditer(text):
+        if match.end() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def _hard_split(text: str, max_bytes: int) -> List[str]:
+    """Last resort for a run with no spaces (e.g. long CJK sentences): cut on character boundaries."""
+    pieces = []
+    current: List[str] = []
+    current_bytes = 0
+    for char in text:
+        char_bytes = utf8_len(char)
+        if current and current_bytes + char_bytes > max_bytes:
+            pieces.append("".join(current))
+            current, current_bytes = [], 0
+        current.append(char)
+        current_bytes += char_bytes
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+def _pack(pieces: Iterable[str], max_bytes: int) -> List[str]:
+    """Greedily joins consecutive pieces (each already within budget) up to `max_bytes`."""
+    chunks = []
+    current: List[str] = []
+    current_bytes = 0
+    for piece in pieces:
+        piece_bytes = utf8_len(piece)
+        if current and current_bytes + piece_bytes > max_bytes:
+            chunks.append("".join(current).strip())
+            current, current_bytes = [], 0
+        current.append(piece)
+        current_bytes += piece_bytes
+    if current:
+        chunks.append("".join(current).strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+def _sentence_pieces(paragraph: str, max_bytes: int) -> List[str]:
+    """
+    Splits a paragraph into sentences, each within `max_bytes`. Sentences that
+    are still too long are split by word, then by character.
+    """
+    pieces = []
+    for sentence in _split_keeping_text(paragraph, SENTENCE_BOUNDARY):
+        if utf8_len(sentence) <= max_bytes:
+            pieces.append(sentence)
+            continue
+        for word in _split_keeping_text(sentence, WHITESPACE):
+            if utf8_len(word) <= max_bytes:
+                pieces.append(word)
+            else:
+                pieces.extend(_hard_split(word, max_bytes))
+    return pieces
+
+
+def split_oversized_paragraph_by_sentence(paragraph: str, max_bytes: int = MAX_TTS_CHUNK_BYTES) -> List[str]:
+    """
+    Splits an extremely long paragraph into smaller sub-chunks by sentence,
+    each at most `max_bytes` once encoded as UTF-8.
+    """
+    return _pack(_sentence_pieces(paragraph, max_bytes), max_bytes)
+
+
+def split_first_chunk(tts_chunks: List[str], limit: int) -> List[str]:
+    """
+    Splits a short head (whole sentences, at most `limit` UTF-8 bytes) off the
+    first chunk so the first audio segment can be synthesized quickly.
+    """
+    first = tts_chunks[0]
+    if utf8_len(first) <= limit:
+        return tts_chunks
+
+    head = split_oversized_paragraph_by_sentence(first, limit)[0]
+    rest = first[first.index(head) + len(head):].strip()
+    return [head] + ([rest] if rest else []) + tts_chunks[1:]
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import weakref
+from typing import Any, Dict
+
+from config import GEMINI_API_KEY
+
+# Gemini models and the Text-to-Speech client are created on first use and shared
+# by every agent, thread and Streamlit session in the process. Nothing here is
+# imported or constructed until a request actually needs it, so starting the app
+# (or processing a DOCX, which never touches TTS) stays fast.
+#
+# The async API uses `GenerativeModel.generate_content_async`, whose client the
+# genai SDK shares process-wide, so drive it from one long-lived event loop per process.
+
+_lock = threading.Lock()
+_models: Dict[str, Any] = {}
+_tts_client = None
+# gRPC asyncio channels belong to the event loop they were created on
+_tts_async_clients = weakref.WeakKeyDictionary()
+_gemini_configured = False
+
+
+def gemini_model(model_name: str):
+    """Returns the shared `genai.GenerativeModel` for `model_name`, configuring the API key once."""
+    global _gemini_configured
+    with _lock:
+        if model_name not in _models:
+            import google.generativeai as genai
+            if not _gemini_configured:
+                genai.configure(api_key=GEMINI_API_KEY)
+                _gemini_configured = True
+            _models[model_name] = genai.GenerativeModel(model_name)
+        return _models[model_name]
+
+
+def tts_client():
+    """Returns the shared Text-to-Speech client, creating it (and its credentials) on first use."""
+    global _tts_client
+    with _lock:
+        if _tts_client is None:
+            from google.cloud import texttospeech
+            _load_streamlit_credentials()
+            _tts_client = texttospeech.TextToSpeechClient()
+        return _tts_client
+
+
+def tts_async_client():
+    """Returns the Text-to-Speech async client for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _tts_async_clients.get(loop)
+        if client is None:
+            from google.cloud import texttospeech
+            _load_streamlit_credentials()
+            client = _tts_async_clients[loop] = texttospeech.TextToSpeechAsyncClient()
+        return client
+
+
+def _load_streamlit_credentials() -> None:
+    # Set up Google Cloud credentials from Streamlit secrets. Outside Streamlit (CLI,
+    # workers, benchmarks) the standard GOOGLE_APPLICATION_CREDENTIALS lookup is used instead.
+    try:
+        import streamlit as st
+        credentials_data = st.secrets["credentials"]
+    except (ImportError, FileNotFoundError, KeyError):
+        return
+
+    if isinstance(credentials_data, str):
+        credentials_dict = json.loads(credentials_data)
+    else:
+        credentials_dict = dict(credentials_data)
+
+    # Write credentials to temporary file
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
+        json.dump(credentials_dict, temp_file)
+        credentials_path = temp_file.name
+
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
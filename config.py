@@ -1,6 +1,98 @@
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()  # loads .env
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Maximum number of summarize requests kept in flight at once while processing a PDF.
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "8"))
+
+# Disk-backed cache for Gemini summarize/explain responses. Set LLM_CACHE_PATH="" to disable.
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+
+# Ask Gemini to pick an agent when a file matches no registered signature or extension.
+ROUTER_LLM_FALLBACK = os.getenv("ROUTER_LLM_FALLBACK", "false").lower() in ("1", "true", "yes")
+
+# Text-to-Speech: chunks synthesized in parallel, and retries for transient/quota errors.
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+TTS_MAX_RETRIES = int(os.getenv("TTS_MAX_RETRIES", "5"))
+
+# Disk-backed cache of synthesized chunk audio, evicted by least recent use above
+# TTS_CACHE_MAX_BYTES in total. Set TTS_CACHE_PATH="" to disable.
+TTS_CACHE_PATH = os.getenv("TTS_CACHE_PATH", ".cache/tts_cache.sqlite3")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+
+# Client-side rate limiting. Gemini quotas are per model: GEMINI_RPM/GEMINI_TPM apply to every
+# model unless GEMINI_MODEL_LIMITS overrides it, e.g. '{"gemini-2.5-flash": {"rpm": 150, "tpm": 1000000}}'.
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "1000"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_DEFAULT_LIMITS = {"rpm": GEMINI_RPM, "tpm": GEMINI_TPM}
+GEMINI_MODEL_LIMITS = json.loads(os.getenv("GEMINI_MODEL_LIMITS", "{}"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+# Text-to-Speech quota in requests and input characters per minute. A quota of 0 is not paced.
+TTS_RPM = float(os.getenv("TTS_RPM", "1000"))
+TTS_CHARS_PER_MINUTE = float(os.getenv("TTS_CHARS_PER_MINUTE", "150000"))
+# Number of processes sharing these quotas (queue workers); each process gets an equal share.
+RATE_LIMIT_PROCESSES = max(1, int(os.getenv("RATE_LIMIT_PROCESSES", "1")))
+# Concurrency lowered after a quota error only grows back once this many seconds pass without one.
+RATE_LIMIT_QUIET_SECONDS = float(os.getenv("RATE_LIMIT_QUIET_SECONDS", "10"))
+
+# Exponential backoff (seconds) used between retries; each wait is jittered.
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30.0"))
+
+# OCR for scanned pages: render resolution and size of the tesseract process pool.
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+
+# Markdown extraction of large PDFs is split into page ranges across this many processes.
+# Documents with fewer than PDF_EXTRACT_MIN_PAGES pages per worker use fewer workers (1 = in-process).
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_EXTRACT_MIN_PAGES = int(os.getenv("PDF_EXTRACT_MIN_PAGES", "25"))
+
+# PDF triage: pages whose images cover at least TRIAGE_SCAN_COVERAGE of the page are treated as
+# scans. Scans with fewer text-layer characters than TRIAGE_MIN_TEXT_CHARS are OCRed instead of
+# converted to markdown; scans with a real text layer get both.
+TRIAGE_MIN_TEXT_CHARS = int(os.getenv("TRIAGE_MIN_TEXT_CHARS", "25"))
+TRIAGE_SCAN_COVERAGE = float(os.getenv("TRIAGE_SCAN_COVERAGE", "0.6"))
+
+# Images sent to the vision model are downscaled to this longest side (pixels) and re-encoded as JPEG.
+IMAGE_MAX_DIM = int(os.getenv("IMAGE_MAX_DIM", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Every image on a page (or paragraph) is explained in one vision request returning a JSON
+# list; pages with more images than this are split over several requests.
+VISION_BATCH_MAX_IMAGES = int(os.getenv("VISION_BATCH_MAX_IMAGES", "8"))
+
+# Pack several pages into one summarize request (JSON array answer). A budget of 0 disables batching.
+SUMMARY_BATCH_TOKEN_BUDGET = int(os.getenv("SUMMARY_BATCH_TOKEN_BUDGET", "6000"))
+SUMMARY_BATCH_MAX_PAGES = int(os.getenv("SUMMARY_BATCH_MAX_PAGES", "20"))
+
+# Per-document job checkpoints so interrupted runs resume. Set JOBS_DIR="" to disable.
+JOBS_DIR = os.getenv("JOBS_DIR", ".cache/jobs")
+JOBS_MAX_AGE_DAYS = float(os.getenv("JOBS_MAX_AGE_DAYS", "7"))
+
+# Tracing: per-stage spans appended as JSON lines (TRACE_LOG_PATH="" disables the file) and
+# served in Prometheus text format by each queue worker, worker i on METRICS_PORT + i
+# (0 disables the endpoints).
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", ".cache/traces.jsonl")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Background job queue: Home.py submits jobs to this SQLite file and QUEUE_WORKERS worker
+# processes run extraction and narration. Narration parts and merged audio go to QUEUE_OUTPUT_DIR.
+QUEUE_PATH = os.getenv("QUEUE_PATH", ".cache/queue.sqlite3")
+QUEUE_OUTPUT_DIR = os.getenv("QUEUE_OUTPUT_DIR", ".cache/outputs")
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", "2"))
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "0.5"))
+# A running job whose worker has not sent a heartbeat for this long is handed to another worker.
+QUEUE_STALE_SECONDS = float(os.getenv("QUEUE_STALE_SECONDS", "120"))
+
+# Batch narration CLI (batch_narrate.py): documents narrated in parallel, one process each,
+# and where their MP3/text outputs and manifest.json are written.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", "narrations")
@@ -0,0 +1,52 @@
+from typing import Awaitable, Callable, List, TypeVar
+
+from json_batches import accepts_json_list, answer_in_batches, aanswer_in_batches
+from llm_cache import cached_generate, acached_generate
+
+T = TypeVar("T")
+
+
+def build_images_prompt(count: int, context_summary: str) -> str:
+    return (
+        f"The {count} attached images appear together on one page, in reading order.\n"
+        "Write one concise, natural sentence describing each image. "
+        "If an image clearly connects to the given summary, include that meaningfully. "
+        "Only describe what is visually present. Do not reference the text or summary directly.\n"
+        f"Respond with only a JSON array of exactly {count} strings, "
+        "one description per image, in the same order as the images."
+        f"\n\nSummary (for context): {context_summary}\n"
+    )
+
+
+def chunk_images(images: List[T], max_images: int) -> List[List[T]]:
+    """Splits a page's images into groups of at most `max_images` (one request each)."""
+    max_images = max(1, max_images)
+    return [images[i:i + max_images] for i in range(0, len(images), max_images)]
+
+
+def explain_images(model, images: List[bytes], context_summary: str,
+                   explain_one: Callable[[bytes, str], str]) -> List[str]:
+    """
+    Describes every image of a page with one vision request and maps the JSON
+    answer back in order. A single image uses `explain_one` (the per-image prompt).
+    If the answer cannot be parsed, the images are split in half and each half retried.
+    """
+    return answer_in_batches(
+        images,
+        lambda batch: cached_generate(model, build_images_prompt(len(batch), context_summary), batch,
+                                      validate=accepts_json_list(len(batch))),
+        lambda image: explain_one(image, context_summary),
+        "image descriptions",
+    )
+
+
+async def aexplain_images(model, images: List[bytes], context_summary: str,
+                          explain_one: Callable[[bytes, str], Awaitable[str]]) -> List[str]:
+    """Async counterpart of explain_images(); `explain_one` is a coroutine function."""
+    return await aanswer_in_batches(
+        images,
+        lambda batch: acached_generate(model, build_images_prompt(len(batch), context_summary), batch,
+                                       validate=accepts_json_list(len(batch))),
+        lambda image: explain_one(image, context_summary),
+        "image descriptions",
+    )
@@ -0,0 +1,38 @@
+import hashlib
+import io
+
+from PIL import Image
+
+from config import IMAGE_MAX_DIM, IMAGE_JPEG_QUALITY
+
+
+def image_digest(image_bytes: bytes) -> str:
+    """Content hash used to explain each unique image only once per document."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def prepare_image(image_bytes: bytes, max_dim: int = IMAGE_MAX_DIM, quality: int = IMAGE_JPEG_QUALITY) -> bytes:
+    """
+    Downscales an image so its longest side is at most `max_dim` pixels and
+    re-encodes it as JPEG. Images PIL cannot read are returned unchanged.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.load()
+    except (OSError, Image.DecompressionBombError):
+        return image_bytes
+
+    img.thumbnail((max_dim, max_dim))
+
+    # JPEG has no alpha channel, so flatten transparent images onto white
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import QUEUE_PATH, QUEUE_STALE_SECONDS, JOBS_MAX_AGE_DAYS
+
+# Job states, in the order a job moves through them
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_JSON_COLUMNS = ("payload", "progress", "result")
+
+# A job whose worker died this many times (e.g. a document that crashes the parser) is failed
+MAX_ATTEMPTS = 3
+
+
+class JobQueue:
+    """
+    Durable FIFO of processing jobs shared by the Streamlit app and the workers.
+
+    Each job is a row in SQLite holding its kind ("process" or "narrate"), a JSON
+    payload, its status, JSON progress/result and the error message if it failed.
+    Workers claim the oldest queued job in a write transaction, so two workers
+    never run the same job, and send heartbeats while it runs so a job left
+    behind by a dead worker is queued again.
+    """
+
+    def __init__(self, path: str = QUEUE_PATH, stale_seconds: float = QUEUE_STALE_SECONDS):
+        self.path = path
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit mode, so claim() can open its own write transaction; Streamlit
+        # sessions poll from several threads, so one connection is shared behind a lock
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL lets the app read job status while a worker is writing progress
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " progress TEXT,"
+            " result TEXT,"
+            " error TEXT,"
+            " worker TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL,"
+            " started REAL,"
+            " heartbeat REAL,"
+            " finished REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_status ON jobs(status, id)")
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> int:
+        """Queues a job and returns its id."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, status, created) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload, ensure_ascii=False), QUEUED, time.time()),
+            )
+            return cursor.lastrowid
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Returns the job as a dict (JSON columns decoded), or None if it does not exist."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _decode(row) if row else None
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Marks the oldest queued job as running for `worker` and returns it, or None if the queue is empty."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_stale(now)
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, started = ?, heartbeat = ?,"
+                        " attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, worker, now, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = _decode(row)
+        job.update(status=RUNNING, worker=worker, started=now, attempts=job["attempts"] + 1)
+        return job
+
+    def _requeue_stale(self, now: float) -> None:
+        if self.stale_seconds <= 0:
+            return
+        cutoff = now - self.stale_seconds
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ?"
+            " WHERE status = ? AND heartbeat < ? AND attempts >= ?",
+            (FAILED, "Worker stopped responding", now, RUNNING, cutoff, MAX_ATTEMPTS),
+        )
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat < ?",
+            (QUEUED, RUNNING, cutoff),
+        )
+
+    def heartbeat(self, job_id: int, progress: Optional[Dict[str, Any]] = None) -> None:
+        """Records that the job is still alive, optionally with new progress."""
+        with self._lock:
+            if progress is None:
+                self._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), job_id))
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET heartbeat = ?, progress = ? WHERE id = ?",
+                    (time.time(), json.dumps(progress, ensure_ascii=False), job_id),
+                )
+
+    def finish(self, job_id: int, result: Dict[str, Any]) -> None:
+        self._close(job_id, DONE, result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id: int, error: str) -> None:
+        self._close(job_id, FAILED, error=error)
+
+    def _close(self, job_id: int, status: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        """Returns the number of jobs in each state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def prune(self, max_age_days: float = JOBS_MAX_AGE_DAYS) -> None:
+        """Deletes finished and failed jobs older than `max_age_days`."""
+        if max_age_days <= 0:
+            return
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+                (DONE, FAILED, time.time() - max_age_days * 24 * 3600),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    for column in _JSON_COLUMNS:
+        if job.get(column) is not None:
+            job[column] = json.loads(job[column])
+    return job
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Iterable, Optional
+
+from config import JOBS_DIR, JOBS_MAX_AGE_DAYS
+
+
+def file_content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JobCheckpoint:
+    """
+    Checkpoint directory for one processing job, keyed by content hash.
+
+    Every finished unit of work (a page's text, an OCR result, a summary, an image
+    explanation, a chunk's audio) is written as its own file under
+    `<JOBS_DIR>/<job_id>/<stage>/<key>`, so a re-run of the same job skips it.
+    With an empty root, checkpointing is disabled and every lookup misses.
+    """
+
+    def __init__(self, job_id: str, root: str = JOBS_DIR):
+        self.job_id = job_id
+        self.path = os.path.join(root, job_id) if root else None
+
+    @classmethod
+    def for_file(cls, file_path: str, root: str = JOBS_DIR) -> "JobCheckpoint":
+        """Job keyed by the document's content hash."""
+        return cls(file_content_hash(file_path), root)
+
+    @classmethod
+    def for_parts(cls, parts: Iterable[str], root: str = JOBS_DIR) -> "JobCheckpoint":
+        """Job keyed by a hash of several strings, e.g. narration settings plus every chunk."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8") + b"\0")
+        return cls(digest.hexdigest(), root)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _file(self, stage: str, key: Any, suffix: str) -> str:
+        return os.path.join(self.path, stage, f"{key}{suffix}")
+
+    def _write(self, target: str, data: bytes) -> None:
+        # Write to a temp file first so a crash never leaves a half-written checkpoint
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_path, target)
+        # Keep the job directory's mtime current so prune_jobs only removes idle jobs
+        os.utime(self.path)
+
+    def get(self, stage: str, key: Any, default: Any = None) -> Any:
+        """Returns the JSON value stored for (stage, key), or `default`."""
+        if not self.enabled:
+            return default
+        try:
+            with open(self._file(stage, key, ".json"), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return default
+
+    def put(self, stage: str, key: Any, value: Any) -> None:
+        if self.enabled:
+            self._write(self._file(stage, key, ".json"), json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def get_bytes(self, stage: str, key: Any) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        try:
+            with open(self._file(stage, key, ".bin"), "rb") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def put_bytes(self, stage: str, key: Any, data: bytes) -> None:
+        if self.enabled:
+            self._write(self._file(stage, key, ".bin"), data)
+
+    def discard(self) -> None:
+        """Deletes the job's checkpoints, once a finished job no longer needs them."""
+        if self.enabled:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+def prune_jobs(root: str = JOBS_DIR, max_age_days: float = JOBS_MAX_AGE_DAYS) -> None:
+    """Deletes job directories that have not been modified for `max_age_days`."""
+    if not root or not os.path.isdir(root) or max_age_days <= 0:
+        return
+    cutoff = time.time() - max_age_days * 24 * 3600
+    for name in os.listdir(root):
+        job_path = os.path.join(root, name)
+        if os.path.isdir(job_path) and os.path.getmtime(job_path) < cutoff:
+            shutil.rmtree(job_path, ignore_errors=True)
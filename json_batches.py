@@ -0,0 +1,78 @@
+import json
+import logging
+import re
+from typing import Awaitable, Callable, Generator, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# What a batching step asks its driver for: one answer for one item, or a JSON list for several
+ONE, MANY = "one", "many"
+
+
+def parse_json_list(response: str, expected: int) -> Optional[List[str]]:
+    """Parses the model's JSON array; returns None unless it holds exactly `expected` strings."""
+    # Models often wrap JSON in a ```json fence
+    body = re.sub(r"^```(?:json)?\s*|\s*```$", "", response.strip())
+    try:
+        answers = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(answers, list) or len(answers) != expected:
+        return None
+    if not all(isinstance(answer, str) for answer in answers):
+        return None
+    return [answer.strip() for answer in answers]
+
+
+def accepts_json_list(expected: int) -> Callable[[str], bool]:
+    """Cache validator: only answers that parse into `expected` strings are kept."""
+    return lambda response: parse_json_list(response, expected) is not None
+
+
+def _steps(items: Sequence[T], what: str) -> Generator[Tuple[str, Sequence[T]], str, List[str]]:
+    # The batching logic, without the model calls: yields what to ask, receives the
+    # answer, and returns one answer per item. A JSON answer that cannot be parsed
+    # splits the batch in half; a single item is asked on its own.
+    if len(items) == 1:
+        answer = yield ONE, items
+        return [answer]
+
+    parsed = parse_json_list((yield MANY, items), len(items))
+    if parsed is not None:
+        return parsed
+
+    logger.warning("%d %s could not be parsed, splitting", len(items), what)
+    middle = len(items) // 2
+    first = yield from _steps(items[:middle], what)
+    second = yield from _steps(items[middle:], what)
+    return first + second
+
+
+def answer_in_batches(items: Sequence[T], ask_many: Callable[[Sequence[T]], str],
+                      ask_one: Callable[[T], str], what: str) -> List[str]:
+    """
+    Returns one answer per item, in order. `ask_many(items)` sends several items in
+    one request and returns the raw JSON-array answer; `ask_one(item)` answers a
+    single item. `what` names the answers in log messages (e.g. "page summaries").
+    """
+    steps = _steps(items, what)
+    try:
+        kind, batch = next(steps)
+        while True:
+            kind, batch = steps.send(ask_one(batch[0]) if kind == ONE else ask_many(batch))
+    except StopIteration as done:
+        return done.value
+
+
+async def aanswer_in_batches(items: Sequence[T], ask_many: Callable[[Sequence[T]], Awaitable[str]],
+                             ask_one: Callable[[T], Awaitable[str]], what: str) -> List[str]:
+    """Async counterpart of answer_in_batches(); both callables return awaitables."""
+    steps = _steps(items, what)
+    try:
+        kind, batch = next(steps)
+        while True:
+            kind, batch = steps.send(await (ask_one(batch[0]) if kind == ONE else ask_many(batch)))
+    except StopIteration as done:
+        return done.value
@@ -0,0 +1,194 @@
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional, Sequence
+
+from PIL import Image
+
+from config import LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_AGE_DAYS, GEMINI_MAX_RETRIES
+from rate_limiter import gemini_limiter, estimate_gemini_tokens
+from retry import call_with_backoff, acall_with_backoff
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache for Gemini responses.
+
+    Entries are keyed by the model name plus a hash of the prompt and image bytes,
+    stored in SQLite, and evicted by age and by least-recent use once the entry
+    limit is exceeded. Hit/miss counters are kept for the lifetime of the process.
+    A failing read or write (e.g. the file is locked by another worker for too
+    long) is logged and treated as a miss, so it never fails the request.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000, max_age_days: float = 30):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Summaries run from a thread pool, so one connection is shared behind a lock
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            # Several worker processes share the file; WAL lets them read while one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses(last_used)")
+            self._conn.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, images: Sequence[bytes] = ()) -> str:
+        """Builds the cache key from the model name, the prompt and every image, in order."""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8") + b"\0")
+        digest.update(prompt.encode("utf-8") + b"\0")
+        for image_bytes in images:
+            digest.update(hashlib.sha256(image_bytes).digest())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response, or None on a miss or an expired entry."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or (self.max_age_seconds and now - row[1] > self.max_age_seconds):
+                    self.misses += 1
+                    return None
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self._conn.rollback()
+                logger.warning("LLM cache read failed, treating as a miss: %s", e)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, model_name: str, response: str) -> None:
+        """Stores a response and evicts expired and least recently used entries."""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, model_name, response, now, now),
+                )
+                self._evict(now)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self._conn.rollback()
+                logger.warning("LLM cache write failed, response not cached: %s", e)
+
+    def _evict(self, now: float) -> None:
+        if self.max_age_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age_seconds,))
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the number of stored entries."""
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def clear(self) -> None:
+        if self.enabled:
+            with self._lock:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+
+# Shared by every agent so identical requests are only paid for once
+llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_AGE_DAYS)
+
+
+def _contents(prompt: str, images: Sequence[bytes]):
+    if not images:
+        return prompt
+    return [prompt] + [Image.open(io.BytesIO(image_bytes)) for image_bytes in images]
+
+
+def _store(key: str, model_name: str, resp, validate: Optional[Callable[[str], bool]]) -> str:
+    text = resp.text.strip() if resp.text else ""
+
+    # Empty answers are usually blocked or failed generations, so they are not worth keeping
+    if text and (validate is None or validate(text)):
+        llm_cache.set(key, model_name, text)
+    return text
+
+
+def cached_generate(model, prompt: str, images: Sequence[bytes] = (),
+                    validate: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Calls `model.generate_content` with the prompt and images, unless the same
+    model, prompt and image bytes were answered before. Returns the stripped text.
+    Requests are paced by the model's rate limiter and quota errors retried.
+    If `validate` is given, only answers it accepts are cached.
+    """
+    key = LLMCache.make_key(model.model_name, prompt, images)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Misses go through the model's shared rate limiter; quota errors shrink its concurrency and are retried
+    resp = call_with_backoff(
+        gemini_limiter(model.model_name).call,
+        model.generate_content,
+        _contents(prompt, images),
+        units=estimate_gemini_tokens(prompt, len(images)),
+        max_retries=GEMINI_MAX_RETRIES,
+    )
+    return _store(key, model.model_name, resp, validate)
+
+
+async def acached_generate(model, prompt: str, images: Sequence[bytes] = (),
+                           validate: Optional[Callable[[str], bool]] = None) -> str:
+    """Async counterpart of cached_generate(), using `model.generate_content_async`."""
+    key = LLMCache.make_key(model.model_name, prompt, images)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+
+    resp = await acall_with_backoff(
+        gemini_limiter(model.model_name).acall,
+        model.generate_content_async,
+        _contents(prompt, images),
+        units=estimate_gemini_tokens(prompt, len(images)),
+        max_retries=GEMINI_MAX_RETRIES,
+    )
+    return _store(key, model.model_name, resp, validate)
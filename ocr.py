@@ -0,0 +1,50 @@
+import io
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from typing import Callable, Iterable, List, Optional
+
+from PIL import Image
+
+# ocr_image_bytes runs in pool processes that import this module fresh, so it only
+# needs PIL here and pytesseract on first use, never the agents or Gemini clients.
+
+
+def ocr_image_bytes(image_bytes: bytes) -> str:
+    """Runs tesseract on one encoded page image."""
+    # needs tesseract-ocr; imported on first use since most documents have no scanned pages
+    import pytesseract
+    return pytesseract.image_to_string(Image.open(io.BytesIO(image_bytes))).strip()
+
+
+def ocr_images(images: Iterable[bytes], count: int, workers: int,
+               on_result: Optional[Callable[[int, str], None]] = None) -> List[str]:
+    """
+    OCRs page images across a process pool and returns the text in input order.
+
+    `images` may be a lazy generator: at most two images per worker are held in
+    memory at once, so rendering and recognition overlap without buffering the book.
+    `on_result(position, text)` is called as each image finishes (e.g. to checkpoint).
+    """
+    results: List[str] = [""] * count
+
+    def finish(position: int, text: str) -> None:
+        results[position] = text
+        if on_result:
+            on_result(position, text)
+
+    workers = max(1, min(workers, count))
+    if workers == 1:
+        for position, image in enumerate(images):
+            finish(position, ocr_image_bytes(image))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for position, image in enumerate(images):
+            pending[pool.submit(ocr_image_bytes, image)] = position
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(pending.pop(future), future.result())
+        for future in as_completed(pending):
+            finish(pending[future], future.result())
+    return results
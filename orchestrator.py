@@ -1,41 +1,134 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Optional, Tuple
 
-from PdfReaderAgent import PdfReaderAgent
-from DocumentReaderAgent import DocumentReaderAgent
+from agent_registry import AgentRegistry, is_pdf, is_docx
+from job_store import file_content_hash, prune_jobs
+from tracing import span, trace_context
+from clients import gemini_model
+from rate_limiter import gemini_limiter, estimate_gemini_tokens
 
-import google.generativeai as genai
-from config import GEMINI_API_KEY
+from config import ROUTER_LLM_FALLBACK
 
-genai.configure(api_key=GEMINI_API_KEY)
-text_model = genai.GenerativeModel("gemini-2.0-flash-lite-preview")
+ROUTER_MODEL = "gemini-2.0-flash-lite-preview"
+
+logger = logging.getLogger(__name__)
 
 class Orchestrator:
-    def __init__(self):
-        self.pdf_agent = PdfReaderAgent()
-        self.doc_agent = DocumentReaderAgent()
+    def __init__(self, llm_fallback: bool = ROUTER_LLM_FALLBACK):
+        self._pdf_agent = None
+        self._doc_agent = None
+        self.llm_fallback = llm_fallback
+
+        # Drop checkpoints of jobs that have been idle longer than JOBS_MAX_AGE_DAYS
+        prune_jobs()
+
+        self.registry = AgentRegistry()
+        # Agents (and their PDF/DOCX libraries) are only loaded when a file is routed to them
+        self.register_agent("PdfReaderAgent", lambda path: self.pdf_agent.process_pdf(path), (".pdf",), is_pdf,
+                            async_handler=lambda path: self.pdf_agent.aprocess_pdf(path))
+        self.register_agent("DocumentReaderAgent", lambda path: self.doc_agent.process_word_doc(path),
+                            (".docx",), is_docx, async_handler=lambda path: self.doc_agent.aprocess_word_doc(path))
         # Add other agents here when needed
 
-    def route_task(self, file_path: str) -> str:
+    @property
+    def pdf_agent(self):
+        if self._pdf_agent is None:
+            from PdfReaderAgent import PdfReaderAgent
+            self._pdf_agent = PdfReaderAgent()
+        return self._pdf_agent
+
+    @property
+    def doc_agent(self):
+        if self._doc_agent is None:
+            from DocumentReaderAgent import DocumentReaderAgent
+            self._doc_agent = DocumentReaderAgent()
+        return self._doc_agent
+
+    def register_agent(self, name: str, handler: Callable[[str], str],
+                       extensions: Tuple[str, ...] = (), sniff: Optional[Callable[[str], bool]] = None,
+                       async_handler: Optional[Callable[[str], Awaitable[str]]] = None) -> None:
+        """Makes a new agent routable by extension and/or content signature."""
+        self.registry.register(name, handler, extensions, sniff, async_handler)
+
+    def choose_agent(self, file_path: str) -> Optional[str]:
         """
-        Decide which agent(s) should process the file using LLM reasoning.
+        Decide which agent should process the file from its magic bytes and extension.
+        The LLM is only asked when the file is unknown and the fallback is enabled.
         """
+        route = self.registry.resolve(file_path)
+        if route:
+            return route.name
+        if self.llm_fallback:
+            return self._choose_agent_with_llm(file_path)
+        return None
+
+    async def achoose_agent(self, file_path: str) -> Optional[str]:
+        """Async counterpart of choose_agent; the LLM fallback uses the async Gemini client."""
+        route = await asyncio.to_thread(self.registry.resolve, file_path)
+        if route:
+            return route.name
+        if self.llm_fallback:
+            prompt = self._router_prompt(file_path)
+            response = await gemini_limiter(ROUTER_MODEL).acall(
+                gemini_model(ROUTER_MODEL).generate_content_async, prompt, units=estimate_gemini_tokens(prompt)
+            )
+            return self._parse_agent(response.text)
+        return None
+
+    def _router_prompt(self, file_path: str) -> str:
         # Compose a prompt for the LLM
-        prompt = f"""
+        return f"""
         You are an AI orchestrator.
         File path: {file_path}
 
         Decide which agent is most suitable to process this file based on extension.
-        Respond with only the agent name (e.g., 'PdfReaderAgent','DocumentReaderAgent').
+        Respond with only one of these agent names: {', '.join(self.registry.names())}.
+        """
+
+    def _parse_agent(self, response: str) -> Optional[str]:
+        chosen_agent = response.strip().strip("'\"`")
+        return chosen_agent if self.registry.get(chosen_agent) else None
+
+    def _choose_agent_with_llm(self, file_path: str) -> Optional[str]:
+        prompt = self._router_prompt(file_path)
+        response = gemini_limiter(ROUTER_MODEL).call(
+            gemini_model(ROUTER_MODEL).generate_content, prompt, units=estimate_gemini_tokens(prompt)
+        )
+        return self._parse_agent(response.text)
+
+    def route_task(self, file_path: str) -> str:
+        """
+        Route the file to the registered agent that can process it.
+        """
+        # Every span recorded while this document is processed carries its id
+        with trace_context(document_id=file_content_hash(file_path)[:12], file=os.path.basename(file_path)):
+            with span("route") as record:
+                chosen_agent = self.choose_agent(file_path)
+                record["agent"] = chosen_agent
+            logger.info("Routing %s to %s", file_path, chosen_agent)
+
+            if chosen_agent is None:
+                return f"No suitable agent found for the file.."
+            return self.registry.get(chosen_agent).handler(file_path)
+
+    async def aroute_task(self, file_path: str) -> str:
+        """
+        Async counterpart of route_task: awaits the agent's coroutine handler, so one
+        event loop can process many documents at once. Agents registered without one
+        run their blocking handler in the default executor.
         """
+        document_id = (await asyncio.to_thread(file_content_hash, file_path))[:12]
+        with trace_context(document_id=document_id, file=os.path.basename(file_path)):
+            with span("route") as record:
+                chosen_agent = await self.achoose_agent(file_path)
+                record["agent"] = chosen_agent
+            logger.info("Routing %s to %s", file_path, chosen_agent)
 
-        response = text_model.generate_content(prompt)
-      
-        chosen_agent = response.text.strip()
-        print(chosen_agent)
-
-        # Dynamic routing
-        if chosen_agent == "PdfReaderAgent":
-            return self.pdf_agent.process_pdf(file_path)
-        elif chosen_agent == "DocumentReaderAgent":
-            return self.doc_agent.process_word_doc(file_path)
-        else:
-            return f"No suitable agent found for the file.."
+            if chosen_agent is None:
+                return f"No suitable agent found for the file.."
+            route = self.registry.get(chosen_agent)
+            if route.async_handler is None:
+                return await asyncio.to_thread(route.handler, file_path)
+            return await route.async_handler(file_path)
@@ -0,0 +1,102 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Sequence
+
+import fitz
+
+# Page-range workers (extract_page_list) import this module on their own; it depends on
+# PyMuPDF alone, with pymupdf4llm loaded inside the worker function.
+
+# Extraction routes chosen by triage_pages()
+MARKDOWN = "markdown"
+OCR = "ocr"
+BOTH = "both"
+
+
+def triage_page(page: fitz.Page, min_text_chars: int, scan_coverage: float) -> Dict[str, Any]:
+    """
+    Cheap look at one page (no layout analysis, no rendering): text-layer
+    character count, image count and the fraction of the page covered by images,
+    plus the route it should take:
+    - "ocr": images cover most of the page and there is (almost) no text layer,
+      e.g. a scanned page that only has a page number
+    - "both": images cover most of the page, but there is a real text layer too
+      (scan with a caption, or a scan that already has an OCR layer)
+    - "markdown": everything else, including short text pages such as chapter titles
+    """
+    text_chars = len("".join(page.get_text("text").split()))
+    bboxes = [fitz.Rect(info["bbox"]) & page.rect for info in page.get_image_info()]
+    bboxes = [bbox for bbox in bboxes if not bbox.is_empty]
+    page_area = abs(page.rect) or 1.0
+    coverage = min(1.0, sum(abs(bbox) for bbox in bboxes) / page_area)
+
+    # Only a page that looks like a scan is OCRed; a short text layer alone means a sparse page
+    if coverage < scan_coverage:
+        route = MARKDOWN
+    elif text_chars < min_text_chars:
+        route = OCR
+    else:
+        route = BOTH
+    return {
+        "route": route,
+        "text_chars": text_chars,
+        "image_count": len(bboxes),
+        "image_coverage": round(coverage, 3),
+        "image_bboxes": [list(bbox) for bbox in bboxes],
+    }
+
+
+def triage_pages(doc: fitz.Document, min_text_chars: int, scan_coverage: float) -> List[Dict[str, Any]]:
+    """Triage record (see triage_page) for every page, in order."""
+    return [triage_page(page, min_text_chars, scan_coverage) for page in doc]
+
+
+def _page_records(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Image boxes are taken from triage_page(): pymupdf4llm's page chunks do not
+    # reliably list the pictures of a page across versions
+    return [{"text": chunk.get("text", "").strip()} for chunk in chunks]
+
+
+def extract_page_list(pdf_path: str, page_numbers: Sequence[int]) -> List[Dict[str, Any]]:
+    """
+    Converts the given pages to markdown and returns one {"text"}
+    record per page, in order. Opens the PDF itself, so it can run in a pool worker.
+    """
+    # Imported here: pymupdf4llm is slow to load and only needed for PDFs
+    import pymupdf4llm
+
+    with fitz.open(pdf_path) as doc:
+        chunks = pymupdf4llm.to_markdown(doc, pages=list(page_numbers), page_chunks=True, write_images=False)
+    return _page_records(chunks)
+
+
+def split_pages(page_numbers: Sequence[int], parts: int) -> List[List[int]]:
+    """Splits the pages into at most `parts` contiguous runs of near-equal length."""
+    parts = max(1, min(parts, len(page_numbers)))
+    size, extra = divmod(len(page_numbers), parts)
+    runs, start = [], 0
+    for i in range(parts):
+        stop = start + size + (1 if i < extra else 0)
+        runs.append(list(page_numbers[start:stop]))
+        start = stop
+    return runs
+
+
+def extract_pages(pdf_path: str, page_numbers: Sequence[int], workers: int,
+                  min_pages_per_worker: int = 25) -> List[Dict[str, Any]]:
+    """
+    Markdown extraction of `page_numbers` split into page ranges across a process
+    pool; each worker opens the PDF on its own and the ranges are merged back in
+    page order. Small documents, or `workers` <= 1, are converted in-process,
+    since starting a pool costs more than it saves.
+    """
+    page_numbers = list(page_numbers)
+    workers = max(1, min(workers, len(page_numbers) // max(1, min_pages_per_worker)))
+    if workers == 1:
+        return extract_page_list(pdf_path, page_numbers)
+
+    # A few more ranges than workers, so one slow range (dense tables, big images)
+    # does not leave the other cores idle at the end
+    runs = split_pages(page_numbers, workers * 2)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(extract_page_list, [pdf_path] * len(runs), runs)
+        return [page for run in results for page in run]
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Tuple, Type, TypeVar
+
+from google.api_core import exceptions as google_exceptions
+
+from config import (GEMINI_DEFAULT_LIMITS, GEMINI_MODEL_LIMITS, GEMINI_MAX_CONCURRENCY,
+                    TTS_RPM, TTS_CHARS_PER_MINUTE, TTS_CONCURRENCY,
+                    RATE_LIMIT_PROCESSES, RATE_LIMIT_QUIET_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Errors that mean "over quota": concurrency is halved and the request budget drained
+QUOTA_ERRORS: Tuple[Type[BaseException], ...] = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+)
+
+# Seconds between checks while an async caller waits for a free concurrency slot
+ASYNC_POLL_INTERVAL = 0.02
+
+# Gemini bills each image as a fixed number of input tokens
+IMAGE_TOKENS = 258
+
+
+class TokenBucket:
+    """Refills `per_minute` units evenly over each minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """
+        Takes `amount` units right away, borrowing against future refills if the
+        bucket is short, and returns how many seconds the caller must wait before
+        using them. Callers are served in the order they reserve.
+        """
+        if self.per_minute <= 0:
+            return 0.0
+        # A single request larger than the bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return max(0.0, -self._tokens * 60 / self.per_minute)
+
+    def drain(self) -> None:
+        """Empties the bucket, so callers wait for a refill after the server pushed back."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0)
+
+
+class AdaptiveLimiter:
+    """
+    Client-side scheduler for one quota (a Gemini model, or Text-to-Speech).
+
+    Every call takes a concurrency slot, one request from the per-minute request
+    bucket and its size (tokens or characters) from the per-minute unit bucket.
+    On a quota error the concurrency limit is halved and the request bucket
+    drained; after `quiet_seconds` without quota errors, each run of `limit`
+    successful calls raises the limit by one again, up to `max_concurrency`.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, units_per_minute: float,
+                 max_concurrency: int, quiet_seconds: float = RATE_LIMIT_QUIET_SECONDS):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.units = TokenBucket(units_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.quiet_seconds = quiet_seconds
+        self.active = 0
+        self.quota_errors = 0
+        self._successes = 0
+        self._last_quota_error = 0.0
+        self._condition = threading.Condition()
+
+    def _try_enter(self) -> bool:
+        with self._condition:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            return False
+
+    def _leave(self) -> None:
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def _reserve(self, units: float) -> float:
+        return max(self.requests.reserve(1), self.units.reserve(units))
+
+    @contextmanager
+    def slot(self, units: float = 1) -> Iterator[None]:
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+        try:
+            delay = self._reserve(units)
+            if delay:
+                time.sleep(delay)
+            yield
+        except QUOTA_ERRORS:
+            self._on_quota_error()
+            raise
+        else:
+            self._on_success()
+        finally:
+            self._leave()
+
+    def call(self, func: Callable[..., T], *args, units: float = 1, **kwargs) -> T:
+        """Runs `func(*args, **kwargs)` within the quota; `units` is its token or character cost."""
+        with self.slot(units):
+            return func(*args, **kwargs)
+
+    async def acall(self, func: Callable[..., Awaitable[T]], *args, units: float = 1, **kwargs) -> T:
+        """
+        Async counterpart of call(): awaits `func(*args, **kwargs)` within the
+        same quota and concurrency limit, without blocking the event loop.
+        """
+        # The limit is shared with threads, so a full gate is polled rather than awaited
+        while not self._try_enter():
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+        try:
+            delay = self._reserve(units)
+            if delay:
+                await asyncio.sleep(delay)
+            result = await func(*args, **kwargs)
+        except QUOTA_ERRORS:
+            self._on_quota_error()
+            raise
+        else:
+            self._on_success()
+            return result
+        finally:
+            self._leave()
+
+    def _on_quota_error(self) -> None:
+        self.requests.drain()
+        with self._condition:
+            self.quota_errors += 1
+            self._successes = 0
+            self._last_quota_error = time.monotonic()
+            if self.limit > 1:
+                self.limit = max(1, self.limit // 2)
+                logger.warning("%s: quota error, concurrency lowered to %d", self.name, self.limit)
+
+    def _on_success(self) -> None:
+        with self._condition:
+            self._successes += 1
+            quiet = time.monotonic() - self._last_quota_error >= self.quiet_seconds
+            if quiet and self.limit < self.max_concurrency and self._successes >= self.limit:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+                logger.info("%s: quiet period, concurrency raised to %d", self.name, self.limit)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {"limit": self.limit, "active": self.active, "quota_errors": self.quota_errors}
+
+
+# ==================== Process-wide limiters ====================
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def _shared(key: str, factory: Callable[[], AdaptiveLimiter]) -> AdaptiveLimiter:
+    with _registry_lock:
+        if key not in _limiters:
+            _limiters[key] = factory()
+        return _limiters[key]
+
+
+def gemini_limiter(model_name: str) -> AdaptiveLimiter:
+    """Limiter for one Gemini model (RPM/TPM from GEMINI_MODEL_LIMITS, else GEMINI_DEFAULT_LIMITS)."""
+    name = model_name.split("/")[-1]
+    limits = {**GEMINI_DEFAULT_LIMITS, **GEMINI_MODEL_LIMITS.get(name, {})}
+    # Worker processes share the project's quota, so each takes an equal share
+    return _shared(f"gemini:{name}", lambda: AdaptiveLimiter(
+        name,
+        limits["rpm"] / RATE_LIMIT_PROCESSES,
+        limits["tpm"] / RATE_LIMIT_PROCESSES,
+        GEMINI_MAX_CONCURRENCY,
+    ))
+
+
+def tts_limiter() -> AdaptiveLimiter:
+    """Limiter for Text-to-Speech requests, measured in requests and characters per minute."""
+    return _shared("tts", lambda: AdaptiveLimiter(
+        "text-to-speech",
+        TTS_RPM / RATE_LIMIT_PROCESSES,
+        TTS_CHARS_PER_MINUTE / RATE_LIMIT_PROCESSES,
+        TTS_CONCURRENCY,
+    ))
+
+
+def estimate_gemini_tokens(prompt: str, image_count: int = 0, chars_per_token: int = 4) -> int:
+    return len(prompt) // chars_per_token + 1 + image_count * IMAGE_TOKENS
+
+
+def limiter_stats() -> Dict[str, dict]:
+    with _registry_lock:
+        limiters = dict(_limiters)
+    return {key: limiter.stats() for key, limiter in limiters.items()}
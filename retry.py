@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Tuple, Type, TypeVar
+
+from google.api_core import exceptions as google_exceptions
+
+from config import RETRY_BASE_DELAY, RETRY_MAX_DELAY
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: quota (429) and temporary server/network failures
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.Aborted,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def backoff_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff: a random wait in [0, min(max_delay, base * 2^attempt)]."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_backoff(func: Callable[..., T], *args, max_retries: int = 5,
+                      retry_on: Tuple[Type[BaseException], ...] = TRANSIENT_ERRORS, **kwargs) -> T:
+    """
+    Calls `func(*args, **kwargs)`, retrying transient errors with jittered
+    exponential backoff. The last error is re-raised once retries run out.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except retry_on as e:
+            if attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning("Transient error (%s), retry %d/%d in %.1fs", type(e).__name__, attempt + 1, max_retries, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+async def acall_with_backoff(func: Callable[..., Awaitable[T]], *args, max_retries: int = 5,
+                             retry_on: Tuple[Type[BaseException], ...] = TRANSIENT_ERRORS, **kwargs) -> T:
+    """Async counterpart of call_with_backoff(): awaits `func`, sleeping without blocking the event loop."""
+    attempt = 0
+    while True:
+        try:
+            return await func(*args, **kwargs)
+        except retry_on as e:
+            if attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning("Transient error (%s), retry %d/%d in %.1fs", type(e).__name__, attempt + 1, max_retries, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,71 @@
+from typing import Awaitable, Callable, List
+
+from json_batches import accepts_json_list, answer_in_batches, aanswer_in_batches
+from llm_cache import cached_generate, acached_generate
+
+# Rough token estimate for budgeting prompts; Gemini averages ~4 characters per token
+CHARS_PER_TOKEN = 4
+
+# Fixed prompt text around the pages, counted against the budget
+PROMPT_OVERHEAD_TOKENS = 100
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def pack_batches(texts: List[str], token_budget: int, max_items: int) -> List[List[int]]:
+    """
+    Greedily packs consecutive texts into batches whose estimated prompt size stays
+    within `token_budget`. A text that is larger than the budget gets its own batch.
+    Returns the positions of the texts in each batch.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = PROMPT_OVERHEAD_TOKENS
+
+    for position, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], PROMPT_OVERHEAD_TOKENS
+        current.append(position)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(texts: List[str]) -> str:
+    pages = "\n\n".join(f"### Page {i + 1}\n{text}" for i, text in enumerate(texts))
+    return (
+        f"Provide a brief one-line summary of each of the following {len(texts)} pages.\n"
+        f"Respond with only a JSON array of exactly {len(texts)} strings, "
+        "one summary per page, in the same order as the pages.\n\n"
+        f"{pages}"
+    )
+
+
+def summarize_batch(model, texts: List[str], summarize_one: Callable[[str], str]) -> List[str]:
+    """
+    Summarizes several texts with one request and maps the JSON answer back in order.
+    If the answer cannot be parsed, the batch is split in half and each half retried;
+    a single text falls back to `summarize_one`.
+    """
+    return answer_in_batches(
+        texts,
+        lambda batch: cached_generate(model, build_batch_prompt(batch), validate=accepts_json_list(len(batch))),
+        summarize_one,
+        "page summaries",
+    )
+
+
+async def asummarize_batch(model, texts: List[str], summarize_one: Callable[[str], Awaitable[str]]) -> List[str]:
+    """Async counterpart of summarize_batch(); `summarize_one` is a coroutine function."""
+    return await aanswer_in_batches(
+        texts,
+        lambda batch: acached_generate(model, build_batch_prompt(batch), validate=accepts_json_list(len(batch))),
+        summarize_one,
+        "page summaries",
+    )
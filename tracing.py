@@ -0,0 +1,158 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+from config import TRACE_LOG_PATH, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Latency histogram buckets (seconds), from fast local steps up to long network calls
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, float("inf"))
+
+# Tags (e.g. document_id) inherited by every span opened inside trace_context()
+_context_tags: contextvars.ContextVar = contextvars.ContextVar("trace_tags", default={})
+
+
+class SpanMetrics:
+    """In-process aggregate of finished spans, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.sums: Dict[str, float] = {}
+        self.buckets: Dict[str, list] = {}
+        self.errors: Dict[str, int] = {}
+        self.bytes_in: Dict[str, int] = {}
+        self.bytes_out: Dict[str, int] = {}
+
+    def observe(self, record: Dict[str, Any]) -> None:
+        name = record["span"]
+        duration = record["duration_s"]
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.sums[name] = self.sums.get(name, 0.0) + duration
+            counts = self.buckets.setdefault(name, [0] * len(BUCKETS))
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    counts[i] += 1
+            if "error" in record:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            for key, totals in (("bytes_in", self.bytes_in), ("bytes_out", self.bytes_out)):
+                if isinstance(record.get(key), int):
+                    totals[name] = totals.get(name, 0) + record[key]
+
+    def render(self) -> str:
+        lines = [
+            "# HELP eduvoice_span_duration_seconds Time spent in each pipeline stage.",
+            "# TYPE eduvoice_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for name in sorted(self.counts):
+                for bound, count in zip(BUCKETS, self.buckets[name]):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'eduvoice_span_duration_seconds_bucket{{span="{name}",le="{le}"}} {count}')
+                lines.append(f'eduvoice_span_duration_seconds_sum{{span="{name}"}} {self.sums[name]:.6f}')
+                lines.append(f'eduvoice_span_duration_seconds_count{{span="{name}"}} {self.counts[name]}')
+
+            lines += ["# HELP eduvoice_span_errors_total Spans that ended with an exception.",
+                      "# TYPE eduvoice_span_errors_total counter"]
+            lines += [f'eduvoice_span_errors_total{{span="{name}"}} {count}' for name, count in sorted(self.errors.items())]
+
+            lines += ["# HELP eduvoice_span_bytes_total Bytes consumed and produced by each stage.",
+                      "# TYPE eduvoice_span_bytes_total counter"]
+            for direction, totals in (("in", self.bytes_in), ("out", self.bytes_out)):
+                lines += [f'eduvoice_span_bytes_total{{span="{name}",direction="{direction}"}} {total}'
+                          for name, total in sorted(totals.items())]
+        return "\n".join(lines) + "\n"
+
+
+metrics = SpanMetrics()
+_log_lock = threading.Lock()
+
+
+def _export(record: Dict[str, Any]) -> None:
+    metrics.observe(record)
+    logger.debug("span %s", record)
+    if not TRACE_LOG_PATH:
+        return
+    try:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with _log_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(TRACE_LOG_PATH)), exist_ok=True)
+            with open(TRACE_LOG_PATH, "a", encoding="utf-8") as fh:
+                fh.write(line)
+    except OSError as e:
+        # Telemetry must never break the pipeline
+        logger.warning("Could not write trace record: %s", e)
+
+
+@contextmanager
+def span(name: str, **tags: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Times a pipeline stage. Yields the span record so the caller can add tags
+    known only at the end (e.g. bytes_out). Tags from trace_context() are included.
+    """
+    record: Dict[str, Any] = {"span": name, **_context_tags.get(), **tags}
+    record["start"] = time.time()
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration_s"] = round(time.perf_counter() - started, 6)
+        _export(record)
+
+
+@contextmanager
+def trace_context(**tags: Any) -> Iterator[None]:
+    """Adds tags (e.g. document_id) to every span opened inside the block."""
+    token = _context_tags.set({**_context_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _context_tags.reset(token)
+
+
+def propagate(func: Callable[..., T]) -> Callable[..., T]:
+    """Wraps `func` so it runs with the caller's trace tags when executed in a thread pool."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs) -> T:
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Serves /metrics in Prometheus text format from a daemon thread. Returns None if disabled."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving Prometheus metrics on :%d/metrics", port)
+    return server
@@ -0,0 +1,215 @@
+import argparse
+import atexit
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from config import QUEUE_OUTPUT_DIR, QUEUE_POLL_INTERVAL, QUEUE_WORKERS, JOBS_MAX_AGE_DAYS, METRICS_PORT
+from job_queue import JobQueue
+from job_store import prune_jobs
+from tracing import start_metrics_server, trace_context
+
+logger = logging.getLogger(__name__)
+
+# Agents are built once per process (queue worker or batch_narrate.py), on the first job that needs them
+_agents: Dict[str, Any] = {}
+
+
+def get_orchestrator():
+    """The process's shared Orchestrator, built on first use."""
+    if "orchestrator" not in _agents:
+        from orchestrator import Orchestrator
+        _agents["orchestrator"] = Orchestrator()
+    return _agents["orchestrator"]
+
+
+def get_narrator():
+    """The process's shared NarratorAgent, built on first use."""
+    if "narrator" not in _agents:
+        from NarratorAgent import NarratorAgent
+        _agents["narrator"] = NarratorAgent()
+    return _agents["narrator"]
+
+
+# ==================== 1. Job handlers ====================
+
+def run_process_job(job: Dict[str, Any], report: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """Extracts, cleans and chunks the uploaded document. Payload: {"file_path"}."""
+    from chunker import chunk_text_for_narration, FIRST_TTS_CHUNK_BYTES
+
+    report({"stage": "processing"})
+    text = get_orchestrator().route_task(job["payload"]["file_path"])
+
+    report({"stage": "chunking"})
+    chunks = chunk_text_for_narration(text, first_chunk_limit=FIRST_TTS_CHUNK_BYTES)
+    return {"text": text, "chunks": chunks}
+
+
+def run_narrate_job(job: Dict[str, Any], report: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """
+    Synthesizes the chunks and merges them into one MP3. Payload: {"chunks", "gender", "language"}.
+
+    Each part is written to the job's output directory and reported as soon as it
+    is ready, so the app can start playing part 1 while the rest is synthesized.
+    The final MP3 is merged from the audio already in memory, not read back from
+    the part files.
+    """
+    payload = job["payload"]
+    chunks = payload["chunks"]
+    output_dir = job_output_dir(job["id"])
+    os.makedirs(output_dir, exist_ok=True)
+
+    narrator = get_narrator()
+    chunk_audio: List[bytes] = []
+    parts: List[str] = []
+    report({"stage": "narrating", "parts": parts, "total": len(chunks)})
+    audio_stream = narrator.stream_speech(
+        chunks=chunks,
+        gender=payload.get("gender", "NEUTRAL"),
+        language=payload.get("language", "en-US"),
+    )
+    for i, audio in enumerate(audio_stream):
+        part_path = os.path.join(output_dir, f"part_{i+1:04d}.mp3")
+        write_atomic(part_path, audio)
+        chunk_audio.append(audio)
+        parts.append(part_path)
+        report({"stage": "narrating", "parts": parts, "total": len(chunks)})
+
+    report({"stage": "merging", "parts": parts, "total": len(chunks)})
+    audio_path = os.path.join(output_dir, "final_story.mp3")
+    with open(audio_path + ".tmp", "wb") as fh:
+        narrator.merge_chunk_audio(chunk_audio, fh)
+    os.replace(audio_path + ".tmp", audio_path)
+    return {"audio_path": audio_path, "parts": parts}
+
+
+def job_output_dir(job_id: int) -> str:
+    """Directory holding the files a job produced (narration parts and the merged MP3)."""
+    return os.path.join(QUEUE_OUTPUT_DIR, str(job_id))
+
+
+def discard_job_output(job_id: int) -> None:
+    """Deletes a job's output files once the app no longer needs them."""
+    shutil.rmtree(job_output_dir(job_id), ignore_errors=True)
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Writes `data` to `path` via a temp file, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]], Dict[str, Any]]] = {
+    "process": run_process_job,
+    "narrate": run_narrate_job,
+}
+
+
+# ==================== 2. Worker loop ====================
+
+def run_worker(name: str, poll_interval: float = QUEUE_POLL_INTERVAL, metrics_port: int = 0) -> None:
+    """
+    Claims and runs jobs until the process is stopped. A background thread keeps
+    sending heartbeats while a job runs, so long single stages (e.g. OCR of a
+    large scan) are not mistaken for a dead worker.
+
+    Spans are recorded in the worker, so it serves its own /metrics on
+    `metrics_port` (0 disables the endpoint).
+    """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        start_metrics_server(metrics_port)
+    except OSError as e:
+        # A busy port only costs this worker its metrics, not its jobs
+        logger.warning("Worker %s cannot serve metrics on :%d: %s", name, metrics_port, e)
+    queue = JobQueue()
+    parent_pid = os.getppid()
+    logger.info("Worker %s started", name)
+
+    # Exit with the app: a worker whose parent is gone has been re-parented
+    while os.getppid() == parent_pid:
+        job = queue.claim(name)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        logger.info("Worker %s running %s job %d", name, job["kind"], job["id"])
+        done = threading.Event()
+        beat = threading.Thread(target=_keep_alive, args=(queue, job["id"], done), daemon=True)
+        beat.start()
+        try:
+            handler = JOB_HANDLERS[job["kind"]]
+            with trace_context(job_id=job["id"], job_kind=job["kind"]):
+                result = handler(job, lambda progress: queue.heartbeat(job["id"], progress))
+            queue.finish(job["id"], result)
+        except Exception as e:
+            logger.exception("Job %d failed", job["id"])
+            queue.fail(job["id"], f"{type(e).__name__}: {e}")
+        finally:
+            done.set()
+            beat.join()
+
+
+def _keep_alive(queue: JobQueue, job_id: int, done: threading.Event) -> None:
+    interval = max(1.0, queue.stale_seconds / 4)
+    while not done.wait(interval):
+        queue.heartbeat(job_id)
+
+
+def start_workers(count: int = QUEUE_WORKERS) -> List[multiprocessing.Process]:
+    """
+    Starts `count` worker processes that live as long as the calling process.
+
+    Workers are spawned rather than forked, so they do not inherit gRPC clients
+    or Streamlit state, and are not daemonic, so the OCR step can still start
+    its own process pool inside them. With METRICS_PORT set, worker i serves
+    its metrics on METRICS_PORT + i.
+    """
+    JobQueue().prune()
+    prune_jobs(QUEUE_OUTPUT_DIR, JOBS_MAX_AGE_DAYS)
+
+    # Workers split the Gemini/TTS quotas between them (unless the deployment set the share itself)
+    os.environ.setdefault("RATE_LIMIT_PROCESSES", str(max(1, count)))
+    context = multiprocessing.get_context("spawn")
+    host = socket.gethostname()
+    workers = []
+    for i in range(count):
+        metrics_port = METRICS_PORT + i if METRICS_PORT else 0
+        process = context.Process(target=run_worker, args=(f"{host}:{os.getpid()}:{i}", QUEUE_POLL_INTERVAL, metrics_port),
+                                  name=f"worker-{i}")
+        process.start()
+        workers.append(process)
+
+    def stop():
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join(timeout=5)
+    atexit.register(stop)
+    return workers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run EduVoice queue workers in the foreground.")
+    parser.add_argument("--workers", type=int, default=max(1, QUEUE_WORKERS),
+                        help="number of worker processes (default: QUEUE_WORKERS)")
+    args = parser.parse_args()
+
+    workers = start_workers(args.workers)
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()